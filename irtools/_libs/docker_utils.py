@@ -1,5 +1,9 @@
 #! /usr/bin/env python
 
+# Standard Imports
+import pipes
+import posixpath
+
 # Lib Imports
 from exec_utils import iexec
 from file_utils import check_makedir
@@ -11,54 +15,74 @@ from irtools import *
 log = logging.getLogger('irtools.utils.docker')
 docker_trace_log = ir_log_dir + '/docker_trace.log'
 
-
-def copy_from_docker(container_id, src, dst, **kwargs):
+# command templates (the format methods are bound once)
+_copy_from_docker_cmd = 'docker cp {container_id}:{src} {dst}'.format
+# streams a tar of the src out of the container straight into tar on the host (no tar is built by the daemon)
+_stream_from_docker_cmd = 'docker exec {container_id} tar cf - -C {src_dir} {src_name} | tar xf - -C {dst}'.format
+_copy_to_docker_cmd = 'docker cp {src} {container_id}:{dst}'.format
+_docker_exec_cmd = 'docker exec {id} {cmd}'.format
+# remove commands by (force, volumes) and by force
+_remove_container_cmds = {
+    (False, False): 'docker rm',
+    (True, False): 'docker rm --force',
+    (False, True): 'docker rm --volumes',
+    (True, True): 'docker rm --force --volumes',
+}
+_remove_image_cmds = {
+    False: 'docker rmi',
+    True: 'docker rmi --force',
+}
+
+
+def copy_from_docker(container_id, src, dst, stream=False, **kwargs):
+    """
+    copies a file or directory out of a container
+    stream=True pipes "docker exec tar" straight into tar on the host instead of "docker cp" (better for large trees),
+    it requires tar in the container and on the host, and dst is the directory to copy the src into
+    """
     kwargs.setdefault('to_console', False)
     kwargs.setdefault('trace_file', docker_trace_log)
-    log.debug('copying from docker: id={} src={} dst={}'.format(container_id, src, dst))
+    log.debug('copying from docker: id=%s src=%s dst=%s stream=%s', container_id, src, dst, stream)
+    if stream:
+        check_makedir(dst)
+        src_dir, src_name = posixpath.split(posixpath.normpath(src))
+        cmd = _stream_from_docker_cmd(container_id=container_id, src_dir=pipes.quote(src_dir or '/'),
+                                      src_name=pipes.quote(src_name), dst=pipes.quote(dst))
+        return iexec(cmd, **kwargs)
     if os.path.isdir(dst):
         dir_to_make = dst
     else:
         dir_to_make = os.path.dirname(dst)
     check_makedir(dir_to_make)
-    cmd = 'docker cp {container_id}:{src} {dst}'.format(container_id=container_id, src=src, dst=dst)
+    cmd = _copy_from_docker_cmd(container_id=container_id, src=src, dst=dst)
     return iexec(cmd, **kwargs)
 
 
 def copy_to_docker(container_id, src, dst, **kwargs):
     kwargs.setdefault('to_console', False)
     kwargs.setdefault('trace_file', docker_trace_log)
-    log.debug('copying to docker: id={} src={} dst={}'.format(container_id, src, dst))
-    cmd = 'docker cp {src} {container_id}:{dst}'.format(container_id=container_id, src=src, dst=dst)
+    log.debug('copying to docker: id=%s src=%s dst=%s', container_id, src, dst)
+    cmd = _copy_to_docker_cmd(container_id=container_id, src=src, dst=dst)
     return iexec(cmd, **kwargs)
 
 
 def remove_docker_container(container_id, force=False, volumes=True, **kwargs):
     kwargs.setdefault('to_console', False)
     kwargs.setdefault('trace_file', docker_trace_log)
-    cmd = 'docker rm'
-    if force:
-        cmd = '{} --force'.format(cmd)
-    if volumes:
-        cmd = '{} --volumes'.format(cmd)
-    cmd = '{} {}'.format(cmd, container_id)
+    cmd = '{} {}'.format(_remove_container_cmds[bool(force), bool(volumes)], container_id)
     return iexec(cmd, **kwargs)
 
 
 def remove_docker_image(image_id, force=False, **kwargs):
     kwargs.setdefault('to_console', False)
     kwargs.setdefault('trace_file', docker_trace_log)
-    cmd = 'docker rmi'
-    if force:
-        cmd = '{} --force'.format(cmd)
-    cmd = '{} {}'.format(cmd, image_id)
+    cmd = '{} {}'.format(_remove_image_cmds[bool(force)], image_id)
     return iexec(cmd, **kwargs)
 
 
 def get_container_id_from_composition_service(composition_file, service_name, **kwargs):
-    log.trace('getting container id from composition service: composition={} service={}'.format(
-        composition_file, service_name
-    ))
+    log.trace('getting container id from composition service: composition=%s service=%s',
+              composition_file, service_name)
 
     cmd = 'docker-compose -f {composition_file} ps -q {service_name}'.format(
         composition_file=composition_file, service_name=service_name)
@@ -71,8 +95,8 @@ def get_container_id_from_composition_service(composition_file, service_name, **
             composition_file, service_name
         ))
 
-    log.trace('found container id for composition service: container_id={} composition={} service={}'.format(
-        container_id, composition_file, service_name))
+    log.trace('found container id for composition service: container_id=%s composition=%s service=%s',
+              container_id, composition_file, service_name)
     return container_id
 
 
@@ -82,8 +106,8 @@ def docker_compose_exec(composition_file, service_name, cmd, **kwargs):
 
 
 def docker_exec(container_id, cmd, **kwargs):
-    log.debug('performing docker exec: id={} cmd={}'.format(container_id, cmd))
-    return iexec('docker exec {id} {cmd}'.format(id=container_id, cmd=cmd), **kwargs)
+    log.debug('performing docker exec: id=%s cmd=%s', container_id, cmd)
+    return iexec(_docker_exec_cmd(id=container_id, cmd=cmd), **kwargs)
 
 
 __all__ = [
@@ -1,16 +1,5 @@
 #! /usr/bin/env python
 
-# Standard Imports
-import smtplib
-import mimetypes
-from email import encoders
-# from email.message import Message
-from email.mime.audio import MIMEAudio
-from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
 # Lib imports
 from env_utils import get_env
 
@@ -35,6 +24,16 @@ def send_email(recipients, subject, text, attachments=None, message_callback=Non
         log.trace('send_email got no recipients. Skipping.')
         return False
 
+    # Standard Imports (imported on use, every import of utils would pay for them otherwise)
+    import smtplib
+    import mimetypes
+    from email import encoders
+    from email.mime.audio import MIMEAudio
+    from email.mime.base import MIMEBase
+    from email.mime.image import MIMEImage
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
     # extract kwarg options
     retries = kwargs.get('retries', 3)
     server_timeout = kwargs.get('server_timeout', 600)
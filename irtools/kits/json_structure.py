@@ -1,6 +1,8 @@
 #  Standard Imports
 import json
 import types
+import itertools
+from collections import OrderedDict
 
 # irtools Imports
 from irtools import *
@@ -32,6 +34,21 @@ class WrongTypeError(LoadJsonDataError):
     pass
 
 
+class StructureDefinitionError(JsonStructureException):
+    pass
+
+
+class JsonStructureMeta(type):
+    """
+    metaclass for JsonStructure
+    prepares every JsonStructure class once when it is defined, instead of doing the work for every instance
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(JsonStructureMeta, cls).__init__(name, bases, attrs)
+        cls._js_prepare_class()
+
+
 class JsonStructure(object):
     """
     a class which wraps a json object,
@@ -42,6 +59,12 @@ class JsonStructure(object):
     This class can and should be embedded any arbitrary times into itself
     meaning that sub objects that require special functions could be their own JsonStructure, although not required
     """
+    # the instance members are the underlying json data and the cache of property values
+    # note: subclasses that add their own members should declare their own __slots__ to keep instances small
+    __slots__ = ('_json_data', '_property_cache')
+    # the class structures are validated (and properties frozen) when the class is defined
+    __metaclass__ = JsonStructureMeta
+
     # to build a required structure,
     # build a mock of the json object structure, will check key values against types
     # starts from root, to specify that the root of a JsonStructure should always be a dictionary
@@ -71,6 +94,7 @@ class JsonStructure(object):
     #   means accessing js.embedded or js['embedded'] you will get the 'value' from data['deeply']['embedded'].
     # using properties will let you access keys in child members as well, recursively calling .get on the inner objects
     # a property is a dictionary mapping the property key to a list which is the path of .get to get to the value
+    # (the paths are validated and stored as tuples when the class is defined)
     _js_properties = {
 
     }
@@ -82,10 +106,93 @@ class JsonStructure(object):
     # we attempt to convert using required_class(json_data=item)
     # we expect that the required_class will handle its own load validation
     _flag_load_convert = True
+    # cache_properties - property values are cached on the instance after the first get
+    # the cache is cleared whenever data is set through this object (load_data, js[key] = value)
+    # only turn this on if you do not change inner (nested) data in place, those changes can not be detected
+    _flag_cache_properties = False
+    # cache_by_payload - remember the loaded (defaulted and validated) data of the last payloads per class
+    # loading an identical payload again fills it from the remembered data instead of adding defaults and checking
+    # the loaded data ends up the same as a full load (nested JsonStructures are still created through their class)
+    _flag_cache_by_payload = False
+    # how many payloads to remember (least recently used payloads are dropped)
+    _js_payload_cache_size = 128
+
+    # == class caches ==
+    # these are built lazily per class (never share them with a parent class)
+    _js_cached_dir_prefix = None
+    _js_cached_default_get_hook = None
+    _js_cached_payloads = None
+    # set for every class when it is defined (see _js_prepare_class)
+    _js_property_keys = frozenset()
+    _js_compiled_required = ()
+
+    @classmethod
+    def _js_prepare_class(cls):
+        """
+        called once for every JsonStructure class when it is defined (see JsonStructureMeta)
+        validates the required structure and default data, freezes the property paths as tuples
+        and compiles the required structure into a flat list of checks
+        :return:
+        """
+        for structure_name in ('_js_required_structure', '_js_default_data'):
+            structure = getattr(cls, structure_name)
+            if not isinstance(structure, dict) or not isinstance(structure.get('root'), dict):
+                raise StructureDefinitionError(cls.__name__, structure_name)
+        if '_js_properties' in cls.__dict__:
+            # only freeze properties defined by this class, inherited ones are already frozen
+            frozen_properties = {}
+            for key, property_path in cls._js_properties.items():
+                if not isinstance(property_path, (list, tuple)):
+                    raise PropertyPathError(key, property_path)
+                frozen_properties[key] = tuple(property_path)
+            cls._js_properties = frozen_properties
+        # the property names, for fast membership checks on every get
+        cls._js_property_keys = frozenset(cls._js_properties)
+        cls._js_compiled_required = tuple(cls._js_compile_required(cls._js_required_structure['root']))
+
+    @staticmethod
+    def _js_compile_required(required_at_key, path='', parent_slot=0, slots=None):
+        """
+        flattens a required structure into checks, in the same (depth first) order they would be walked
+        each check is a tuple of:
+            (parent_slot, key, path, in_path, required_type_object, match_type, convert_class, slot, required_list,
+             list_convert_class)
+        the data of a dict with required keys is kept in its slot while checking, for the checks of its keys
+        :param required_at_key:
+        :param path: the path of the parent, for debugging location of exceptions
+        :param parent_slot: the slot where the data of the parent is kept while checking (the root is slot 0)
+        :param slots: counts the slots, shared by the whole structure
+        :return: generator of checks
+        """
+        slots = slots if slots is not None else itertools.count(1)
+        for inner_key, required_type_object in required_at_key.items():
+            in_path = '.'.join(filter(None, [path, inner_key]))
+            is_class = isinstance(required_type_object, (types.ClassType, type))
+            if is_class or not isinstance(required_type_object, (list, dict)):
+                match_type = required_type_object
+            else:
+                match_type = type(required_type_object)
+            # only subclasses of JsonStructure can be converted to during loading
+            convert_class = required_type_object if is_class and issubclass(required_type_object, JsonStructure) \
+                else None
+            slot = required_list = list_convert_class = None
+            if isinstance(required_type_object, dict) and required_type_object:
+                slot = next(slots)
+            elif isinstance(required_type_object, list) and required_type_object:
+                required_list = required_type_object
+                if len(required_list) == 1 and isinstance(required_list[0], (types.ClassType, type)) \
+                        and issubclass(required_list[0], JsonStructure):
+                    list_convert_class = required_list[0]
+            yield (parent_slot, inner_key, path, in_path, required_type_object, match_type, convert_class, slot,
+                   required_list, list_convert_class)
+            if slot is not None:
+                for check in JsonStructure._js_compile_required(required_type_object, in_path, slot, slots):
+                    yield check
 
     def __init__(self, json_data=None):
         # members
-        self.__json_data = {}
+        self._json_data = {}
+        self._property_cache = {}
         self.load_data(json_data)
 
     def _add_defaults_to_data(self, json_data=None):
@@ -108,55 +215,74 @@ class JsonStructure(object):
         :param defaults_at_key:
         :return:
         """
+        # bind the methods used for every key once, outside of the loop
+        setdefault = json_data_at_key.setdefault
+        recurse_add_defaults = self.__recurse_add_defaults
+        recurse_add_defaults_list = self.__recurse_add_defaults_list
         # loop over all the keys in this layer of the defaults
         for inner_key, default_value in defaults_at_key.items():
             # we should only enter one of these conditions
             # noinspection PyTypeChecker
             if isinstance(default_value, dict):
                 # value is a dictionary, set to a dictionary
-                json_data_at_key.setdefault(inner_key, {})
-                if default_value.keys():
+                json_data_value = setdefault(inner_key, {})
+                if default_value:
                     # recurse down because this dictionary has keys
-                    self.__recurse_add_defaults(json_data_at_key[inner_key], defaults_at_key[inner_key])
+                    recurse_add_defaults(json_data_value, default_value)
             elif isinstance(default_value, list):
                 # value is a list, set to a list
-                json_data_at_key.setdefault(inner_key, [])
-                if len(default_value):
-                    self.__recurse_add_defaults_list(json_data_at_key[inner_key], defaults_at_key[inner_key])
+                json_data_value = setdefault(inner_key, [])
+                if default_value:
+                    recurse_add_defaults_list(json_data_value, default_value)
             # noinspection PyTypeChecker
             elif isinstance(default_value, (types.ClassType, type)) and issubclass(default_value, JsonStructure):
-                # value is a JsonStructure class, initialize a new one
-                json_data_at_key.setdefault(inner_key, default_value())
+                # value is a JsonStructure class, initialize a new one (only if it is missing)
+                if inner_key not in json_data_at_key:
+                    json_data_at_key[inner_key] = default_value()
             else:
                 # if it is any other type of value we simply set it.
                 # this should be a string or a number of some kind, but we won't be too strict
-                json_data_at_key.setdefault(inner_key, default_value)
+                setdefault(inner_key, default_value)
         # returns the json_data
         return json_data_at_key
 
     def __recurse_add_defaults_list(self, json_data_list, defaults_list):
-        for index, item in enumerate(defaults_list):
-            if index < len(json_data_list):
-                if isinstance(item, dict) and isinstance(json_data_list[index], dict):
-                    self.__recurse_add_defaults(json_data_list[index], item)
-                elif isinstance(item, list) and isinstance(json_data_list[index], list):
-                    self.__recurse_add_defaults_list(json_data_list[index], item)
-            elif isinstance(item, dict):
-                json_data_list.append(self.__recurse_add_defaults({}, item))
-            elif isinstance(item, list):
-                json_data_list.append(self.__recurse_add_defaults_list([], item))
-            elif isinstance(item, JsonStructure):
-                json_data_list.append(item.export_to_json_data())
-            else:
-                json_data_list.append(item)
+        """
+        goes through a list of default data, items that exist in the json_data list are filled with their defaults
+        and items that are missing from the json_data list are added (in bulk)
+        :param json_data_list:
+        :param defaults_list:
+        :return:
+        """
+        existing_count = len(json_data_list)
+        # fill the existing items (zip stops at the end of the shorter list)
+        for item, json_data_item in zip(defaults_list, json_data_list):
+            if isinstance(item, dict) and isinstance(json_data_item, dict):
+                self.__recurse_add_defaults(json_data_item, item)
+            elif isinstance(item, list) and isinstance(json_data_item, list):
+                self.__recurse_add_defaults_list(json_data_item, item)
+        # add the missing items
+        if existing_count < len(defaults_list):
+            json_data_list.extend(self.__make_default_list_item(item) for item in defaults_list[existing_count:])
         return json_data_list
 
+    def __make_default_list_item(self, item):
+        """creates a new list item from its default"""
+        if isinstance(item, dict):
+            return self.__recurse_add_defaults({}, item)
+        elif isinstance(item, list):
+            return self.__recurse_add_defaults_list([], item)
+        elif isinstance(item, JsonStructure):
+            return item.export_to_json_data()
+        return item
+
     def load_data(self, json_data):
         """load a json_object into this JsonStructure"""
         try:
             self._load_data(json_data)
         except Exception as exc:
-            log.error('error loading data: exc={} self={} data={}'.format(exc, repr(self), json_data))
+            # lazy formatting, repr(self) exports all the data so only do it if the log is actually emitted
+            log.error('error loading data: exc=%s self=%r data=%s', exc, self, json_data)
             raise
 
     def _load_data(self, json_data):
@@ -166,89 +292,178 @@ class JsonStructure(object):
         :param json_data:
         :return:
         """
+        # the payload key must be made before defaults are added, since that changes the json_data in place
+        payload_key = self._get_payload_key(json_data) if self._flag_cache_by_payload else None
+        if payload_key is not None:
+            cached_json_data = self._get_cached_payload(payload_key)
+            if cached_json_data is not None:
+                # same payload as before, the cached data is already defaulted and checked
+                # the payload is brought to the state a full load leaves it in (it is changed in place either way)
+                if json_data is None:
+                    json_data = {}
+                self._js_merge_cached_data(json_data, cached_json_data)
+                self._hook_set_json_data(json_data)
+                return
         # add any default data specified
         json_data = self._add_defaults_to_data(json_data)
         # check required data
-        self.__recurse_check_required(json_data, self._js_required_structure['root'])
+        self.__check_required(json_data)
+        if payload_key is not None:
+            self._set_cached_payload(payload_key, self._js_copy_data(json_data))
         # load the data
         self._hook_set_json_data(json_data)
 
-    def __recurse_check_required(self, json_data_at_key, required_at_key, path=''):
+    @staticmethod
+    def _get_payload_key(json_data):
+        """makes the key of a payload for the payload cache, None if the payload can not be a key"""
+        try:
+            return json.dumps(json_data, sort_keys=True)
+        except (TypeError, ValueError):
+            # not plain json (for example, it holds JsonStructure objects)
+            return None
+
+    @classmethod
+    def _get_payload_cache(cls):
+        """gets the payload cache of this class (each class has its own)"""
+        if cls.__dict__.get('_js_cached_payloads') is None:
+            cls._js_cached_payloads = OrderedDict()
+        return cls._js_cached_payloads
+
+    @classmethod
+    def _get_cached_payload(cls, payload_key):
+        """gets the cached json data of a payload (or None) and marks it as recently used"""
+        payload_cache = cls._get_payload_cache()
+        cached_json_data = payload_cache.pop(payload_key, None)
+        if cached_json_data is not None:
+            payload_cache[payload_key] = cached_json_data
+        return cached_json_data
+
+    @classmethod
+    def _set_cached_payload(cls, payload_key, json_data):
+        """caches the json data of a payload, dropping the least recently used payloads over the cache size"""
+        payload_cache = cls._get_payload_cache()
+        payload_cache[payload_key] = json_data
+        while len(payload_cache) > cls._js_payload_cache_size:
+            payload_cache.popitem(last=False)
+
+    @staticmethod
+    def _js_merge_cached_data(json_data, cached_json_data):
         """
-        recursively goes through all required data and verifies the json data matches
-        :param json_data_at_key:
-        :param required_at_key:
-        :param path: for debugging location of exceptions
+        brings a payload identical to a cached one to the loaded state of the cached data, in place
+        missing (default) values are added and nested JsonStructures are created through their class, like a full load
+        """
+        for key, cached_value in cached_json_data.items():
+            if key in json_data:
+                json_data[key] = JsonStructure._js_merge_cached_value(json_data[key], cached_value)
+            else:
+                json_data[key] = JsonStructure._js_rebuild_cached_value(cached_value)
+
+    @staticmethod
+    def _js_merge_cached_value(value, cached_value):
+        """merges one value of a payload with its cached loaded value, returns the loaded value"""
+        if isinstance(cached_value, JsonStructure):
+            # the payload value was converted on load, convert it the same way
+            return cached_value.__class__(json_data=value)
+        if isinstance(cached_value, dict) and isinstance(value, dict):
+            JsonStructure._js_merge_cached_data(value, cached_value)
+        elif isinstance(cached_value, list) and isinstance(value, list):
+            for index, cached_item in enumerate(cached_value):
+                if index < len(value):
+                    value[index] = JsonStructure._js_merge_cached_value(value[index], cached_item)
+                else:
+                    value.append(JsonStructure._js_rebuild_cached_value(cached_item))
+        return value
+
+    @staticmethod
+    def _js_rebuild_cached_value(cached_value):
+        """makes a new value from a cached (default) value, nested JsonStructures are created through their class"""
+        if isinstance(cached_value, dict):
+            return {key: JsonStructure._js_rebuild_cached_value(value) for key, value in cached_value.items()}
+        elif isinstance(cached_value, list):
+            return [JsonStructure._js_rebuild_cached_value(item) for item in cached_value]
+        elif isinstance(cached_value, JsonStructure):
+            return cached_value.__class__(json_data=cached_value.export_to_json_data())
+        return cached_value
+
+    @staticmethod
+    def _js_copy_data(json_data):
+        """
+        copies internal json data, dictionaries and lists are copied recursively and JsonStructures are copied
+        the copies are only kept as payload cache templates (see _js_merge_cached_data), they are never handed out
+        """
+        if isinstance(json_data, dict):
+            return {key: JsonStructure._js_copy_data(value) for key, value in json_data.items()}
+        elif isinstance(json_data, list):
+            return [JsonStructure._js_copy_data(item) for item in json_data]
+        elif isinstance(json_data, JsonStructure):
+            return json_data._js_copy()
+        return json_data
+
+    def _js_copy(self):
+        """copies this JsonStructure without loading the data again (only the json data is copied)"""
+        js_copy = self.__class__.__new__(self.__class__)
+        js_copy._json_data = self._js_copy_data(self._json_data)
+        js_copy._property_cache = {}
+        return js_copy
+
+    def __check_required(self, json_data):
+        """
+        verifies the json data matches the required structure, using the checks compiled when the class was defined
+        :param json_data:
         :return:
         """
-        # loop over all the keys in this layer of the required
-        for inner_key, required_type_object in required_at_key.items():
-            in_path = '.'.join(filter(None, [path, inner_key]))
+        load_convert_allowed = self._flag_load_convert
+        load_convert = self.__load_convert
+        # the data of every dict with required keys, by slot
+        slot_data = {0: json_data}
+        for (parent_slot, inner_key, path, in_path, required_type_object, match_type, convert_class, slot,
+             required_list, list_convert_class) in self._js_compiled_required:
+            json_data_at_key = slot_data[parent_slot]
             # make sure required key exists
             if inner_key not in json_data_at_key:
                 raise MissingKeyError(inner_key, path)
             #  see if we can convert the data to the required type if it isn't already
-            if self.__check_load_convert(required_type_object, json_data_at_key[inner_key]):
-                json_data_at_key[inner_key] = self.__load_convert(
-                    convert_data=json_data_at_key[inner_key],
-                    convert_class=required_type_object,
+            json_data_value = json_data_at_key[inner_key]
+            if convert_class is not None and load_convert_allowed and isinstance(json_data_value, dict):
+                json_data_value = json_data_at_key[inner_key] = load_convert(
+                    convert_data=json_data_value,
+                    convert_class=convert_class,
                     path=in_path,
                 )
             # make sure required type matches or is instance of required class
-            if not self.__check_required_type_match(json_data_at_key[inner_key], required_type_object):
+            if not isinstance(json_data_value, match_type):
                 raise WrongTypeError(required_type_object, in_path)
-            # now perform the recursive and list part
-            # we should only enter one of these conditions
-            if isinstance(required_type_object, dict) and required_type_object.keys():
-                # recurse down because this dictionary has keys
-                self.__recurse_check_required(
-                    json_data_at_key[inner_key],
-                    required_at_key[inner_key],
-                    path=in_path)
-            elif isinstance(required_type_object, list) and len(required_type_object):
+            if slot is not None:
+                # keep the data for the checks of the inner keys
+                slot_data[slot] = json_data_value
+            elif required_list is not None:
                 # check if we can convert the list of json_data into the required type
-                # this will only happen if there is only 1 type specified in the list
-                # (ie: we requires a list to be of json_structure items)
-                # and we check that we can load/convert all the items
-                if len(required_type_object) == 1 and all(
-                        self.__check_load_convert(required_type_object[0], d) for d in json_data_at_key[inner_key]):
+                # this will only happen if there is only 1 json structure type specified in the list
+                # and all the items can be converted
+                if list_convert_class is not None and load_convert_allowed and all(
+                        isinstance(d, dict) for d in json_data_value):
                     # we are going to convert the whole list before validating
-                    json_data_at_key[inner_key] = [self.__load_convert(
+                    json_data_value = json_data_at_key[inner_key] = [load_convert(
                         convert_data=d,
-                        convert_class=required_type_object[0],
+                        convert_class=list_convert_class,
                         path=in_path,
-                    ) for d in json_data_at_key[inner_key]]
-                # recurse down because this list has items in it
+                    ) for d in json_data_value]
                 self.__check_required_list(
-                    json_data_at_key[inner_key],
-                    required_at_key[inner_key],
+                    json_data_value,
+                    required_list,
                     path=in_path)
         # returns the json_data
-        return json_data_at_key
+        return json_data
 
     def __load_convert(self, convert_data, convert_class, path):
         """converts data during loading to required class type"""
         try:
             return convert_class(json_data=convert_data)
         except Exception as exc:
-            log.error('Exception trying to convert data on load: exc={} convert_class={} path={}'.format(
-                exc, convert_class, path))
+            log.error('Exception trying to convert data on load: exc=%s convert_class=%s path=%s',
+                      exc, convert_class, path)
             return convert_data
 
-    def __check_load_convert(self, required_type_object, candidate_data):
-        """checks if we can convert the data to required class type during loading"""
-        if not self._flag_load_convert:
-            # if the flag is off, we should not perform conversions
-            return False
-        if not isinstance(candidate_data, dict):
-            # if the data is not a dictionary, we do not need to convert anything
-            return False
-        if isinstance(required_type_object, (types.ClassType, type)) \
-                and not issubclass(required_type_object, JsonStructure):
-            # if the required type is not a subclass of JsonStructure then we will not convert it
-            return False
-        return True
-
     def __check_required_list(self, json_data_list, required_list, path=''):
         """
         iterates over a list of provided data and checks it against a list of required types
@@ -280,22 +495,26 @@ class JsonStructure(object):
 
     def _hook_set_json_data(self, json_data):
         """a function to provide easy extendability to setting the json data"""
-        self.__json_data = json_data
+        self._json_data = json_data
+        self._property_cache.clear()
 
     def _hook_set_json_key(self, key, value):
         """a function to provide easy extendability to setting a json key"""
-        self.__json_data[key] = value
+        self._json_data[key] = value
+        self._property_cache.clear()
 
     def _hook_get_json_key(self, key):
         """a function to provide easy extendability to getting a json key"""
-        if key in self._js_properties:
+        if key in self._js_property_keys:
             return self._hook_get_property(key)
-        return self.__json_data[key]
+        return self._json_data[key]
 
     def _hook_get_property(self, key, default=None):
         """a function to provide easy extendability to getting a property"""
+        if self._flag_cache_properties and key in self._property_cache:
+            return self._property_cache[key]
         property_path = self._js_properties[key]
-        if not isinstance(property_path, list):
+        if not isinstance(property_path, (list, tuple)):
             raise PropertyPathError(key, property_path)
         try:
             value = reduce(lambda obj, k: obj.get(k), property_path, self)
@@ -307,18 +526,22 @@ class JsonStructure(object):
                 return default
             raise
         else:
+            if self._flag_cache_properties:
+                self._property_cache[key] = value
             return value
 
-    def export_to_json_string(self, **kwargs):
+    def export_to_json_string(self, sort_keys=False, **kwargs):
         """
         exports the data to a json string using json.dumps
+        by default the output is compact and keys are not sorted
+        :param sort_keys: sort the keys in the output (makes it easier to debug issues)
         :return:
         """
         use_default_settings = kwargs.pop('use_default_settings', True)
-        if use_default_settings:
-            # makes it easier to debug issues
-            kwargs.setdefault('sort_keys', True)
-        return json.dumps(self.export_to_json_data(), **kwargs)
+        if use_default_settings and kwargs.get('indent') is None:
+            # compact output, no whitespace after separators
+            kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(self.export_to_json_data(), sort_keys=sort_keys, **kwargs)
 
     def export_to_json_data(self):
         """
@@ -326,7 +549,7 @@ class JsonStructure(object):
         :return: json serializable object (dict)
         """
         export_json_data = {}
-        export_json_data = self.__recurse_export_data(export_json_data, self.__json_data)
+        export_json_data = self.__recurse_export_data(export_json_data, self._json_data)
         return export_json_data
 
     def __recurse_export_data(self, export_json_data_at_key, internal_json_data_at_key):
@@ -383,14 +606,56 @@ class JsonStructure(object):
             return default
 
     def __len__(self):
-        return len(self.__json_data)
+        return len(self._json_data)
 
     def __eq__(self, other):
         if isinstance(other, JsonStructure):
-            return bool(self.export_to_json_data() == other.export_to_json_data())
+            return self._js_deep_equal(self._json_data, other._json_data)
         else:
             return super(JsonStructure, self).__eq__(other)
 
+    @staticmethod
+    def _js_deep_equal(left, right):
+        """
+        compares two internal json data trees without exporting them
+        walks both trees in lockstep (using a stack, not recursion) and stops on the first mismatch
+        :param left:
+        :param right:
+        :return: True if both trees hold the same data
+        """
+        stack = [(left, right)]
+        while stack:
+            left, right = stack.pop()
+            if left is right:
+                continue
+            left_is_js = isinstance(left, JsonStructure)
+            right_is_js = isinstance(right, JsonStructure)
+            if left_is_js and right_is_js:
+                # both are JsonStructure instances, let them compare themselves
+                if not left == right:
+                    return False
+                continue
+            elif left_is_js:
+                # compare the underlying data, same as if it was exported
+                left = left._json_data
+            elif right_is_js:
+                right = right._json_data
+            # we should only enter one of these conditions
+            if isinstance(left, dict):
+                if not isinstance(right, dict) or len(left) != len(right):
+                    return False
+                for key, value in left.items():
+                    if key not in right:
+                        return False
+                    stack.append((value, right[key]))
+            elif isinstance(left, list):
+                if not isinstance(right, list) or len(left) != len(right):
+                    return False
+                stack.extend(zip(left, right))
+            elif isinstance(right, (dict, list)) or left != right:
+                return False
+        return True
+
     def _repr_name(self):
         return self.__class__.__name__
 
@@ -405,16 +670,35 @@ class JsonStructure(object):
 
     def get_fields(self):
         """get a list of the keys that are "real" fields of this object's underlying json"""
-        return sorted(self.__json_data.keys())
+        return sorted(self._json_data.keys())
 
     def get_properties(self):
         """get a list of the keys that are "property" fields of this object"""
         return sorted(self._js_properties.keys())
 
+    @classmethod
+    def _get_dir_prefix(cls):
+        """
+        gets the class level part of __dir__ (class directory and properties)
+        it is cached on the class itself, checking cls.__dict__ so that subclasses build their own
+        :return: tuple of names
+        """
+        if cls.__dict__.get('_js_cached_dir_prefix') is None:
+            cls._js_cached_dir_prefix = tuple(dir(cls)) + tuple(sorted(cls._js_properties.keys()))
+        return cls._js_cached_dir_prefix
+
+    @classmethod
+    def _has_default_get_hook(cls):
+        """checks (once per class) if _hook_get_json_key is the original one, so it is safe to skip it"""
+        default_get_hook = cls.__dict__.get('_js_cached_default_get_hook')
+        if default_get_hook is None:
+            default_get_hook = bool(cls._hook_get_json_key == JsonStructure._hook_get_json_key)
+            cls._js_cached_default_get_hook = default_get_hook
+        return default_get_hook
+
     def __dir__(self):
-        object_directory = dir(self.__class__)
+        object_directory = list(self._get_dir_prefix())
         object_directory.extend(self.get_fields())
-        object_directory.extend(self.get_properties())
         return object_directory
 
     def __getitem__(self, item):
@@ -425,6 +709,10 @@ class JsonStructure(object):
         """provides easy access to this object by allowing js.item access to data members or properties"""
         # note, that we do not provide the opposite action such as we do with __getitem__ and __setitem__
         # mostly because properties make this a very difficult situation - maybe in the future
+        # fast path: a real field (not a property) and the get hook was not extended by a subclass
+        json_data = self._json_data
+        if item in json_data and item not in self._js_property_keys and self._has_default_get_hook():
+            return json_data[item]
         return self._hook_get_json_key(item)
 
     def __setitem__(self, key, value):
@@ -432,4 +720,8 @@ class JsonStructure(object):
         self._hook_set_json_key(key, value)
 
     def __nonzero__(self):
+        """a JsonStructure is always truthy, even when it has no data (otherwise __len__ would be used)"""
         return True
+
+    # python 3 name for __nonzero__
+    __bool__ = __nonzero__
@@ -1,30 +1,63 @@
 #! /usr/bin/env python
 
 # Standard Imports
-import smtplib
+import time
+import atexit
+import errno
+import functools
+import hashlib
+import threading
+import contextlib
 import mimetypes
-from email import encoders
 # from email.message import Message
-from email.mime.audio import MIMEAudio
 from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from Queue import LifoQueue, Empty
 
 # irtools Imports
 from irtools import *
+from thread_pool import ThreadPool
+
+# External Import (pybase64 or workaround)
+try:
+    # SIMD accelerated base64, much faster for large attachments
+    from pybase64 import b64encode
+except ImportError:
+    from base64 import b64encode
 
 # logging
 log = logging.getLogger('irtools.kits.mailer')
 
+# attachments are base64 encoded in lines of 57 bytes (76 encoded characters, the MIME line length limit)
+_base64_line_size = 57
+_attachment_block_size = _base64_line_size * 1024 * 16
+# attachments are only read, so do not update their access time where supported
+_o_noatime = getattr(os, 'O_NOATIME', 0)
+
+# part of the smtp error of a message which is too large for the server
+_size_limits_error = 'size limits'
+
+# read the system mime types once on import, instead of on the first attachment
+mimetypes.init()
+
 # TODO: Test this KIT
 # === WARNING: THIS KIT IS UNTESTED ===
 
 
 class MailMessage(object):
-    # todo: allow message re-use with just recipients changing. or parts changing and re-create message
+
+    # changing any of these fields re-creates the message body (text and attachments) when it is next used
+    _body_fields = frozenset(['text', 'attachments', 'is_html'])
+    # changing any of these fields re-creates only the message headers, the body is re-used
+    _header_fields = frozenset(['subject', 'from_field', 'to_field'])
 
     def __init__(self, subject, from_field, to_field, text, **kwargs):
+        self._body_parts = None
+        self._message = None
+        self._serialized = None
+        self._serialized_bytes = None
+
         self.subject = subject
         self.from_field = from_field
         self.to_field = to_field
@@ -33,40 +66,143 @@ class MailMessage(object):
         self.attachments = kwargs.pop('attachments', None)
         self.is_html = kwargs.pop('html', False)  # plain or html message
 
-        self._message = self.make_message(self.subject, self.to_field, self.from_field, text,
-                                          subtype='html' if self.is_html else 'plain',
-                                          attachments=self.attachments)
-
         super(MailMessage, self).__init__()
 
+    def __setattr__(self, name, value):
+        super(MailMessage, self).__setattr__(name, value)
+        if name in self._body_fields:
+            self.invalidate()
+        elif name in self._header_fields:
+            self.invalidate_headers()
+
+    def invalidate(self):
+        """drops the created message and body, they will be re-created (and re-serialized) when next used"""
+        self._body_parts = None
+        self.invalidate_headers()
+
+    def invalidate_headers(self):
+        """drops the created message but keeps the body, the message will be re-created around it when next used"""
+        self._message = None
+        self._serialized = None
+        self._serialized_bytes = None
+
+    def clone_for_recipients(self, to_field):
+        """
+        creates a copy of this message for other recipients, the copy shares the (already encoded) body
+        :param to_field: the recipients of the new message
+        :return: the new MailMessage
+        """
+        clone = MailMessage(self.subject, self.from_field, to_field, self.text, attachments=self.attachments,
+                            html=self.is_html)
+        clone._body_parts = self.body_parts
+        return clone
+
+    @property
+    def body_parts(self):
+        if self._body_parts is None:
+            self._body_parts = self.make_body(self.text, subtype='html' if self.is_html else 'plain',
+                                              attachments=self.attachments)
+        return self._body_parts
+
+    @property
+    def mime_message(self):
+        if self._message is None:
+            self._message = self.wrap_body(self.body_parts, self.subject, self.to_field, self.from_field)
+        return self._message
+
     @property
     def message(self):
-        return self._message.as_string()
+        """the serialized message, cached so re-sending it does not generate the MIME message again"""
+        if self._serialized is None:
+            self._serialized = self.mime_message.as_string()
+        return self._serialized
+
+    @property
+    def message_bytes(self):
+        """the serialized message with CRLF line endings as sent over SMTP, cached like message"""
+        if self._serialized_bytes is None:
+            message = self.message
+            self._serialized_bytes = '\r\n'.join(message.splitlines())
+            if message.endswith(('\r', '\n')):
+                self._serialized_bytes += '\r\n'
+        return self._serialized_bytes
 
     @staticmethod
     def make_message(subject, recipients, send_mail, text, subtype='plain', attachments=None):
-        # construct message
-        multipart_msg = MIMEMultipart()
-        multipart_msg['Subject'] = subject
-        multipart_msg['To'] = ', '.join(recipients)
-        multipart_msg['From'] = send_mail
-        multipart_msg.attach(MIMEText(text, _subtype=subtype))
-        multipart_msg.preamble = 'You will not see this in a MIME-aware mail reader.\n'
+        body_parts = MailMessage.make_body(text, subtype=subtype, attachments=attachments)
+        return MailMessage.wrap_body(body_parts, subject, recipients, send_mail)
 
+    @staticmethod
+    def make_body(text, subtype='plain', attachments=None):
+        """creates the parts of a message body: the text and then any attachments"""
+        body_parts = [MIMEText(text, _subtype=subtype)]
         if attachments:
             attachments = [attachments] if not isinstance(attachments, list) else attachments
             for attachment in attachments:
-                MailMessage.add_attachment(multipart_msg, attachment)
+                msg_atc = MailMessage.make_attachment(attachment)
+                if msg_atc is not None:
+                    body_parts.append(msg_atc)
+        return body_parts
 
+    @staticmethod
+    def wrap_body(body_parts, subject, recipients, send_mail):
+        """creates a message with the given headers around the body parts"""
+        multipart_msg = MIMEMultipart()
+        multipart_msg['Subject'] = subject
+        multipart_msg['To'] = ', '.join(recipients)
+        multipart_msg['From'] = send_mail
+        for body_part in body_parts:
+            multipart_msg.attach(body_part)
+        multipart_msg.preamble = 'You will not see this in a MIME-aware mail reader.\n'
         return multipart_msg
 
+    @staticmethod
+    def encode_base64_file(file_path):
+        """
+        base64 encodes a file into lines (like encoders.encode_base64) reading it in blocks of whole lines
+        :param file_path: the file to encode
+        :return: the encoded content
+        """
+        line_size = _base64_line_size
+        encoded_lines = []
+        remainder = ''
+        fd = _open_attachment(file_path)
+        try:
+            # read straight from the file descriptor, a python level read buffer would only add copies
+            while True:
+                block = os.read(fd, _attachment_block_size)
+                if not block:
+                    break
+                if remainder:
+                    block = remainder + block
+                lines_end = len(block) - len(block) % line_size
+                encoded_lines.extend(b64encode(block[i:i + line_size]) for i in xrange(0, lines_end, line_size))
+                remainder = block[lines_end:]
+        finally:
+            os.close(fd)
+        if remainder:
+            encoded_lines.append(b64encode(remainder))
+        encoded_lines.append('')  # trailing newline
+        return '\n'.join(encoded_lines)
+
     @staticmethod
     def add_attachment(multipart_msg, attachment):
+        msg_atc = MailMessage.make_attachment(attachment)
+        if msg_atc is not None:
+            multipart_msg.attach(msg_atc)
+
+    @staticmethod
+    def make_attachment(attachment):
+        """
+        creates the message part of an attachment
+        :param attachment: a file path, or a tuple of (file path, attachment name)
+        :return: the message part, or None if the attachment could not be prepared
+        """
         if isinstance(attachment, tuple):
-            fname, aname = attachment
+            attachment, aname = attachment
         else:
             aname = os.path.split(attachment)[1]
-        ctype, encoding = mimetypes.guess_type(attachment)
+        ctype, encoding = _guess_attachment_type(os.path.splitext(attachment)[1])
 
         try:
             if ctype is None or encoding is not None:
@@ -74,32 +210,66 @@ class MailMessage(object):
                 # use a generic bag-of-bits type.
                 ctype = 'application/octet-stream'
             maintype, subtype = ctype.split('/', 1)
-            # todo: optimize below switch cases
-            if maintype == 'text':
-                fp = open(attachment)
-                # Note: we should handle calculating the charset
-                msg_atc = MIMEText(fp.read(), _subtype=subtype)
-                fp.close()
-            elif maintype == 'image':
-                fp = open(attachment, 'rb')
-                msg_atc = MIMEImage(fp.read(), _subtype=subtype)
-                fp.close()
-            elif maintype == 'audio':
-                fp = open(attachment, 'rb')
-                msg_atc = MIMEAudio(fp.read(), _subtype=subtype)
-                fp.close()
-            else:
-                fp = open(attachment, 'rb')
-                msg_atc = MIMEBase(maintype, subtype)
-                msg_atc.set_payload(fp.read())
-                fp.close()
-                # Encode the payload using Base64
-                encoders.encode_base64(msg_atc)
+            msg_atc = _attachment_makers.get(maintype, _make_base64_attachment)(attachment, maintype, subtype)
             # Set the filename parameter
             msg_atc.add_header('Content-Disposition', 'attachment', filename=aname)
-            multipart_msg.attach(msg_atc)
         except Exception as exc:
             log.warn('Exception preparing attachment: file={} exc={}'.format(attachment, exc.message), exc_info=True)
+            return None
+        return msg_atc
+
+
+@utils.Memoized
+def _guess_attachment_type(extension):
+    """guesses the (type, encoding) of an attachment by its extension, memoized since the same extensions repeat"""
+    return mimetypes.guess_type('attachment' + extension)
+
+
+def _open_attachment(file_path):
+    """opens an attachment for reading without updating its access time (when permitted), returns a file descriptor"""
+    flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+    try:
+        return os.open(file_path, flags | _o_noatime)
+    except OSError as exc:
+        # O_NOATIME is only permitted for the owner of the file
+        if not _o_noatime or exc.errno != errno.EPERM:
+            raise
+        return os.open(file_path, flags)
+
+
+def _read_attachment(file_path):
+    """reads a whole attachment, with a single read sized to the file when possible"""
+    fd = _open_attachment(file_path)
+    try:
+        size = os.fstat(fd).st_size
+        chunks = []
+        while True:
+            chunk = os.read(fd, max(size, _base64_line_size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return ''.join(chunks)
+
+
+def _make_text_attachment(file_path, maintype, subtype):
+    # Note: we should handle calculating the charset
+    return MIMEText(_read_attachment(file_path), _subtype=subtype)
+
+
+def _make_base64_attachment(file_path, maintype, subtype):
+    # stream the file into base64 instead of reading it whole and using encoders.encode_base64
+    msg_atc = MIMEBase(maintype, subtype)
+    msg_atc.set_payload(MailMessage.encode_base64_file(file_path))
+    msg_atc['Content-Transfer-Encoding'] = 'base64'
+    return msg_atc
+
+
+# attachment makers by mime maintype, any other maintype is base64 encoded
+_attachment_makers = {
+    'text': _make_text_attachment,
+}
 
 
 class Mailer(object):
@@ -118,12 +288,23 @@ class Mailer(object):
         mail_message = MailMessage(subject, self.username, recipients, text, attachments=attachments, **kwargs)
         return self.send_message(recipients, mail_message, **kwargs)
 
+    def send_many(self, messages, **kwargs):
+        """
+        sends many messages using the current connection to the server
+        :param messages: an iterable of (recipients, mail_message) pairs
+        :return: True when all the messages were sent
+        """
+        for recipients, mail_message in messages:
+            self.send_message(recipients, mail_message, **kwargs)
+        return True
+
     def send_message(self, recipients, mail_message, **kwargs):
         assert isinstance(mail_message, MailMessage)
+        import smtplib
         try:
-            self.server.sendmail(self.username, recipients, mail_message.message)
+            self.server.sendmail(self.username, recipients, mail_message.message_bytes)
         except smtplib.SMTPSenderRefused as exc:
-            if 'size limits' in exc.smtp_error:
+            if _size_limits_error in exc.smtp_error:
                 log.error('Exception sending mail due to size limits: {}'.format(exc), exc_info=True)
                 # todo: in future we could fallback to removing attachments
             raise
@@ -135,39 +316,57 @@ class Mailer(object):
     def disconnect_from_server(self, **kwargs):
         raise NotImplementedError()
 
+    def is_connected(self):
+        """checks if the connection to the server is alive (by sending NOOP)"""
+        if self.server is None:
+            return False
+        try:
+            status = self.server.noop()[0]
+        except Exception as exc:
+            log.trace('connection to server is not alive: server=%s port=%s exc=%s', self.host, self.port, exc)
+            return False
+        return status == 250
+
 
 class SMTPMailer(Mailer):
 
     _default_server_timeout = 600
+    # send ehlo and start tls after connecting, not needed by servers which are connected with ssl
+    _needs_ehlo_starttls = True
 
     def __init__(self, host, port, username, password, **kwargs):
         self.smtp_use_ssl = kwargs.pop('smtp_use_ssl', False)
         super(SMTPMailer, self).__init__(host, port, username, password, **kwargs)
+        # get server class
+        import smtplib
+        self._server_cls = smtplib.SMTP_SSL if self.smtp_use_ssl else smtplib.SMTP
 
     def connect_to_server(self, **kwargs):
-        log.debug('connecting to server: server={} port={}'.format(self.server, self.port))
+        log.debug('connecting to server: server=%s port=%s', self.server, self.port)
         # get kwargs
         server_timeout = kwargs.pop('server_timeout', self._default_server_timeout)
-        # get server class
-        _server_cls = smtplib.SMTP_SSL if self.smtp_use_ssl else smtplib.SMTP
         # connect to server
-        log.trace('contacting SMTP Server: server={} port={} use_ssl={}'.format(
-            self.host, self.port, self.smtp_use_ssl))
-        _server_con = _server_cls(self.host, self.port, timeout=server_timeout)
-        # send ehlo
-        log.trace('sending ehlo: server={} port={}'.format(self.server, self.port))
-        _server_con.ehlo()  # may not be needed or supported
-        # send start tls
-        log.trace('sending start TLS: server={} port={}'.format(self.server, self.port))
-        _server_con.starttls()  # may not be needed or supported
+        log.trace('contacting SMTP Server: server=%s port=%s use_ssl=%s', self.host, self.port, self.smtp_use_ssl)
+        _server_con = self._server_cls(self.host, self.port, timeout=server_timeout)
+        if self._needs_ehlo_starttls:
+            # send ehlo
+            log.trace('sending ehlo: server=%s port=%s', self.server, self.port)
+            _server_con.ehlo()  # may not be needed or supported
+            # send start tls
+            log.trace('sending start TLS: server=%s port=%s', self.server, self.port)
+            _server_con.starttls()  # may not be needed or supported
         # log in to server
-        log.trace(
-            'logging in to SMTP Server: server={} port={} username={}'.format(self.server, self.port, self.username))
+        log.trace('logging in to SMTP Server: server=%s port=%s username=%s', self.server, self.port, self.username)
         _server_con.login(self.username, self.password)
         # success
         self.server = _server_con
         return self.server
 
+    def disconnect_from_server(self, **kwargs):
+        log.debug('disconnecting from server: server=%s port=%s', self.server, self.port)
+        # server.quit() // old way
+        self.server.close()
+
 
 class GoogleSMTPMailer(SMTPMailer):
 
@@ -175,6 +374,8 @@ class GoogleSMTPMailer(SMTPMailer):
     _default_port = 465
     _default_hostname = 'smtp.gmail.com'
     _default_use_ssl = True
+    # like normal SMTP connect but no ehlo or starttls
+    _needs_ehlo_starttls = False
 
     def __init__(self, user_email, app_password, **kwargs):
         kwargs.setdefault('host', self._default_hostname)
@@ -185,35 +386,153 @@ class GoogleSMTPMailer(SMTPMailer):
         kwargs.setdefault('smtp_use_ssl', self._default_use_ssl)
         super(GoogleSMTPMailer, self).__init__(**kwargs)
 
-    def connect_to_server(self, **kwargs):
-        # like normal SMTP connect but no ehlo or starttls  TODO: optimize this and re-use code
-        log.debug('connecting to server: server={} port={}'.format(self.server, self.port))
-        # get kwargs
-        server_timeout = kwargs.pop('server_timeout', self._default_server_timeout)
-        # get server class
-        _server_cls = smtplib.SMTP_SSL if self.smtp_use_ssl else smtplib.SMTP
-        # connect to server
-        log.trace('contacting SMTP Server: server={} port={} use_ssl={}'.format(
-            self.host, self.port, self.smtp_use_ssl))
-        _server_con = _server_cls(self.host, self.port, timeout=server_timeout)
-        # log in to server
-        log.trace(
-            'logging in to SMTP Server: server={} port={} username={}'.format(self.server, self.port, self.username))
-        _server_con.login(self.username, self.password)
-        # success
-        self.server = _server_con
-        return self.server
 
-    def disconnect_from_server(self, **kwargs):
-        log.debug('disconnecting from server: server={} port={}'.format(self.server, self.port))
-        # server.quit() // old way
-        self.server.close()
+class SMTPConnectionPool(object):
+    """
+    a bounded pool of connected mailers which can be shared between threads
+    connections are created lazily (up to max_connections) and re-used between messages,
+    a connection is recycled (disconnected) after max_messages_per_connection messages to respect provider limits
+    """
+
+    _default_max_connections = 5
+    _default_max_messages_per_connection = 100
+    # idle connections used within this many seconds are not checked for liveness before re-use
+    _liveness_check_period = 1
+
+    def __init__(self, mailer_factory, **kwargs):
+        """
+        :param mailer_factory: a callable which returns a new (not connected) Mailer
+        :param kwargs: max_connections, max_messages_per_connection, the rest are passed to connect_to_server
+        """
+        self.mailer_factory = mailer_factory
+        self.max_connections = kwargs.pop('max_connections', self._default_max_connections)
+        self.max_messages_per_connection = kwargs.pop(
+            'max_messages_per_connection', self._default_max_messages_per_connection)
+        self.connect_kwargs = kwargs
+        # one (mailer, send_count, last_used) slot per connection, a slot without a mailer connects on first use
+        # last in first out, so the most recently used (warm) connections are re-used first
+        self._slots = LifoQueue(self.max_connections)
+        for _ in range(self.max_connections):
+            self._slots.put((None, 0, 0))
+
+    def _connect(self):
+        mailer = self.mailer_factory()
+        mailer.connect_to_server(**self.connect_kwargs)
+        return mailer
+
+    @staticmethod
+    def _disconnect(mailer):
+        """disconnects a mailer (ignoring errors)"""
+        try:
+            mailer.disconnect_from_server()
+        except Exception as exc:
+            log.trace('Exception disconnecting from SMTP server: exc=%s', exc)
+
+    def _acquire(self):
+        """waits for a free slot and returns a connected (mailer, send_count) from it"""
+        mailer, send_count, last_used = self._slots.get()
+        if mailer is not None and time.time() - last_used > self._liveness_check_period and not mailer.is_connected():
+            log.trace('pooled mailer connection is not alive, reconnecting')
+            self._disconnect(mailer)
+            mailer = None
+        if mailer is None:
+            try:
+                mailer, send_count = self._connect(), 0
+            except BaseException:
+                # give back the slot whatever interrupted the connect, otherwise it is lost for good
+                self._slots.put((None, 0, 0))
+                raise
+        return mailer, send_count
+
+    def _release(self, mailer, send_count, discard=False):
+        """returns a mailer to its slot, disconnects it instead if it failed or reached the message cap"""
+        if discard or send_count >= self.max_messages_per_connection:
+            self._disconnect(mailer)
+            self._slots.put((None, 0, 0))
+        else:
+            self._slots.put((mailer, send_count, time.time()))
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """
+        context manager which holds a connected mailer from the pool, every use counts as one sent message
+        a connection which raised an exception is not re-used
+        """
+        mailer, send_count = self._acquire()
+        try:
+            yield mailer
+        except BaseException:
+            # also on KeyboardInterrupt, SystemExit or GeneratorExit, otherwise the slot is lost for good
+            self._release(mailer, send_count, discard=True)
+            raise
+        else:
+            self._release(mailer, send_count + 1)
+
+    def send_message(self, recipients, mail_message, **kwargs):
+        with self.acquire() as mailer:
+            return mailer.send_message(recipients, mail_message, **kwargs)
+
+    def send_many_parallel(self, messages, **kwargs):
+        """
+        sends many messages concurrently, using up to max_connections threads
+        :param messages: an iterable of (recipients, mail_message)
+        :return: True if all the messages were sent, otherwise False
+        """
+        pool = ThreadPool(self.max_connections, name='SMTPConnectionPool')
+        for recipients, mail_message in messages:
+            pool.add_task(self.send_message, recipients, mail_message, **kwargs)
+        pool.wait_completion()
+        pool.stop()
+        pool.join()
+        return pool.count_nok == 0
+
+    def close(self):
+        """disconnects all the idle connections of the pool"""
+        for _ in range(self.max_connections):
+            try:
+                mailer, _, _ = self._slots.get_nowait()
+            except Empty:
+                break
+            if mailer is not None:
+                self._disconnect(mailer)
+            self._slots.put((None, 0, 0))
+
+
+# connection pools used by send_email, keyed by the connection details (see _get_mailer_pool)
+# this way repeated calls to send_email re-use connections instead of connecting and logging in every time
+_mailer_pools = {}
+_mailer_pools_lock = threading.Lock()
+
+
+def _get_mailer_pool(user_email, app_password, **kwargs):
+    """gets the SMTPConnectionPool for the GoogleSMTPMailer of these details, creates it if needed"""
+    mailer_factory = functools.partial(GoogleSMTPMailer, user_email, app_password, **kwargs)
+    mailer = mailer_factory()
+    server_timeout = kwargs.get('server_timeout', SMTPMailer._default_server_timeout)
+    # every detail the pooled connections are made with, so a changed password or option gets its own pool
+    # the password is kept in the key as a hash only
+    mailer_key = (mailer.host, mailer.port, mailer.username, hashlib.sha256(str(mailer.password)).hexdigest(),
+                  mailer.smtp_use_ssl, server_timeout)
+    with _mailer_pools_lock:
+        pool = _mailer_pools.get(mailer_key)
+        if pool is None:
+            pool = _mailer_pools[mailer_key] = SMTPConnectionPool(mailer_factory, server_timeout=server_timeout)
+    return pool
+
+
+@atexit.register
+def _close_mailer_pools():
+    """disconnects all the connections in the send_email pools"""
+    with _mailer_pools_lock:
+        for pool in _mailer_pools.values():
+            pool.close()
 
 
 def send_email(recipients, subject, text, attachments=None, **kwargs):
     """
-    Sends an one-off email to recipients with given subject and text uses GoogleSMTPMailer
-    For sending bulk emails you should create a Mailer object - connect once, send your emails, then disconnect
+    Sends an email to recipients with given subject and text uses GoogleSMTPMailer
+    The connections to the SMTP server are kept open and re-used by the next calls (see _mailer_pools)
+    For sending bulk emails you should use an SMTPConnectionPool or a Mailer object
     :param recipients: A list of emails
     :param subject: A subject string
     :param text: A formatting text of content
@@ -240,28 +559,18 @@ def send_email(recipients, subject, text, attachments=None, **kwargs):
     mail_message = MailMessage(subject, send_mail, recipients, text, attachments=attachments, **kwargs)
     log.info('Sending email: recipients={} subject={}'.format(recipients, subject))
 
-    mailer = GoogleSMTPMailer(send_user, send_pswd, **kwargs)
-
+    pool = _get_mailer_pool(send_user, send_pswd, **kwargs)
     while retries > 0:
         retries -= 1
         try:
-            mailer.connect_to_server(**kwargs)
+            pool.send_message(recipients, mail_message, **kwargs)
         except Exception as exc:
-            log.error('Exception connecting to SMTP server: exc={} trace...'.format(exc), exc_info=True)
-            continue
+            log.error('Exception sending email: {}'.format(exc), exc_info=True)
+            if retries > 0:
+                log.debug('retrying to send mail again: retries_remaining=%s', retries)
         else:
-            log.trace('connection to SMTP server succeeded. Sending mail')
-            try:
-                mailer.send_message(recipients, mail_message, **kwargs)
-            except Exception as exc:
-                log.error('Exception sending email: {}'.format(exc.message), exc_info=True)
-                if retries > 0:
-                    log.debug('retrying to send mail again: retries_remaining={}'.format(retries))
-            else:
-                log.trace('mail sent successfully')
-                return True
-        finally:
-            mailer.disconnect_from_server()
+            log.trace('mail sent successfully')
+            return True
     else:
         log.error('Failed to send mail after retries')
         return False
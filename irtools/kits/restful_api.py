@@ -1,13 +1,33 @@
 # Standard Imports
+import Queue
+import atexit
+import cookielib
+import copy
 import itertools
 import json
+import re
+import threading
 
 # irtools Imports
 from irtools import *
 from json_structure import JsonStructure
+from thread_pool import ThreadPool
 
-# External Imports
-import requests
+# External Import (orjson or workaround)
+try:
+    import orjson
+
+    def _dump_log_json(content):
+        """formats json content for the response logs"""
+        try:
+            return orjson.dumps(content, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            # not json data (raw response content)
+            return json.dumps(content, indent=4)
+except ImportError:
+    def _dump_log_json(content):
+        """formats json content for the response logs"""
+        return json.dumps(content, indent=4)
 
 log = logging.getLogger('irtools.kits.restful_api')
 # disable annoying debug logs from urllib3.connectionpool
@@ -15,6 +35,103 @@ urllib_log = logging.getLogger('urllib3.connectionpool')
 urllib_log.setLevel(logging.WARN)
 
 
+# requests wraps the urllib3 error of an aborted connection, which has this message
+_connection_aborted_message = 'Connection aborted.'
+
+
+def _exception_mentions(exc, text):
+    """checks if text is in any string arg of an exception or of the exceptions it wraps, without formatting them"""
+    pending = [exc]
+    while pending:
+        for arg in pending.pop().args:
+            if isinstance(arg, basestring):
+                if text in arg:
+                    return True
+            elif isinstance(arg, BaseException):
+                pending.append(arg)
+    return False
+
+
+class _BlockAllCookies(cookielib.CookiePolicy):
+    """a cookie policy which neither stores nor returns cookies, keeps a shared session stateless"""
+    return_ok = set_ok = domain_return_ok = path_return_ok = lambda self, *args, **kwargs: False
+    netscape = True
+    rfc2965 = hide_cookie2 = False
+
+
+class _TransactionLogWriter(object):
+    """writes transaction logs in a background thread, so requests do not wait for the logs to be written"""
+
+    # the most queued transactions to take at once
+    batch_size = 64
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, func, *args):
+        """queues a call to write logs, starts the writer thread on first use"""
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    thread = threading.Thread(target=self._run, name='TransactionLogWriter')
+                    thread.daemon = True
+                    thread.start()
+                    self.thread = thread
+        self.queue.put((func, args))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # take what else is already queued, so a burst of transactions is written in one wake up
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            for func, args in batch:
+                try:
+                    func(*args)
+                except Exception as exc:
+                    log.error('Exception writing rest transaction logs: exc=%s trace...', exc, exc_info=True)
+                finally:
+                    self.queue.task_done()
+
+    def flush(self):
+        """waits for all the queued logs to be written"""
+        if self.thread is not None:
+            self.queue.join()
+
+
+_transaction_log_writer = _TransactionLogWriter()
+atexit.register(_transaction_log_writer.flush)
+
+
+class _RequestSnapshot(object):
+    """the parts of a sent request the transaction logs read"""
+
+    def __init__(self, request):
+        self.method = request.method
+        self.url = request.url
+        self.body = request.body
+
+
+class _ResponseSnapshot(object):
+    """
+    the parts of a response the transaction logs read, taken in the thread which sent the request
+    logs written later in the background see the response as it was received, whatever the caller does with it
+    """
+
+    def __init__(self, response):
+        self.request = _RequestSnapshot(response.request)
+        self.status_code = response.status_code
+        self.content = response.content
+
+    def json(self):
+        return json.loads(self.content)
+
+
 class RestfulAPI(object):
     """
     A class which wraps the process of sending restful API requests using the requests package
@@ -25,8 +142,23 @@ class RestfulAPI(object):
     # class constants
     # transaction counter as a class constant is useful to prevent clashes with the same id
     transaction_counter = itertools.count()
+    _transaction_counter_lock = threading.Lock()
     # the request timeout helps prevent hanging
     request_timeout = 120
+    # sessions keep connections alive and re-use them, these are the sizes of their connection pools
+    session_pool_connections = 10
+    session_pool_maxsize = 20
+    # failed connections are retried (the request was not sent yet), failed reads are not
+    session_connect_retries = 3
+    # the session used by the class methods when no session is given, created on first use
+    _shared_session = None
+    # options of a request (with their defaults) which are not passed on to requests package
+    _request_option_defaults = (
+        ('ignore_request_timeout', False),
+        ('ignore_connection_aborted', False),
+        ('log_action', True),
+        ('session', None),
+    )
     # these strings/keys are used to help parse kwargs related to logging transactions out of regular kwargs
     _log_keys = [
         '_log_transact_id',
@@ -36,6 +168,9 @@ class RestfulAPI(object):
         '_log_dir_request',
         '_log_dir_response',
     ]
+    # (log key, log kwarg name) pairs, the log kwarg name is the log key without the '_log_' prefix
+    _log_key_map = tuple((lk, lk[5:]) for lk in _log_keys)
+    _log_key_set = frozenset(_log_keys)
     # default log paths
     _cls_log_dir = ir_log_dir  # you should override this in your inheritors
     _cls_request_dir = _cls_log_dir + '/request'
@@ -45,44 +180,104 @@ class RestfulAPI(object):
         'Extra data',
         'No JSON object could be decoded',
     ]
+    # the messages above as a single regex, compiled once per class (see _get_ignored_json_convert_error_re)
+    _ignored_json_convert_error_re = None
     # this file format is here so it can be extended easily
     _format_counter_id = '{id:03}'
     _format_log_file_path = '{directory}/{transaction_id}.txt'
+    # transaction logs are written by a background thread, use flush_transaction_logs to wait for them
+    background_transaction_logs = True
+    # request bodies larger than this are logged as a snapshot of their head and tail (None logs them whole)
+    _max_logged_body_bytes = 64 * 1024
+    # response logs are the response content as is (no parsing), set this to log re-formatted (indented) json
+    pretty_log_responses = False
 
     def __init__(self, base_url, **kwargs):
         self.base_url = base_url
         self.name = kwargs.pop('name', 'rest')
         self.log_rest_dir = kwargs.pop('log_rest_dir', os.path.join(self._cls_log_dir, self.name))
-        self.session = requests.session()
+        self._session = None
 
-    @property
-    def request_data_dir(self):
-        """directory to store request data and logs"""
-        return self.log_rest_dir + '/request'
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     @property
-    def response_data_dir(self):
-        """directory to store response data and logs"""
-        return self.log_rest_dir + '/response'
+    def session(self):
+        """the session of this api, created on first use so objects which send no requests do not need one"""
+        if self._session is None:
+            self._session = self._make_session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def close(self):
+        """closes the session (and its pooled connections)"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
-    def __add_default_log_dirs_to_kwargs(self, kwargs):
-        kwargs.setdefault('_log_dir_request', self.request_data_dir)
-        kwargs.setdefault('_log_dir_response', self.response_data_dir)
+    @classmethod
+    def _make_session(cls):
+        """creates a new session with pooled connections"""
+        # External Imports (imported on use, importing requests is slow)
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=cls.session_pool_connections, pool_maxsize=cls.session_pool_maxsize,
+                              max_retries=Retry(connect=cls.session_connect_retries, read=False))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     @classmethod
-    def _get_log_request_file_path(cls, directory, transact_id):
-        """creates the final file path for request logs"""
-        return cls._format_log_file_path.format(directory=directory, transaction_id=transact_id)
+    def _get_shared_session(cls):
+        """
+        gets the session shared by class method requests which were not given a session
+        the shared session does not keep cookies, so requests stay independent like with requests.get
+        """
+        if RestfulAPI._shared_session is None:
+            session = cls._make_session()
+            session.cookies.set_policy(_BlockAllCookies())
+            RestfulAPI._shared_session = session
+        return RestfulAPI._shared_session
+
+    @property
+    def log_rest_dir(self):
+        """directory to store transaction logs"""
+        return self._log_rest_dir
+
+    @log_rest_dir.setter
+    def log_rest_dir(self, log_rest_dir):
+        self._log_rest_dir = log_rest_dir
+        # directories to store request and response data and logs, set here since every request uses them
+        self.request_data_dir = os.path.join(log_rest_dir, 'request')
+        self.response_data_dir = os.path.join(log_rest_dir, 'response')
+
+    def _request_with_defaults(self, request_func, url, kwargs):
+        """sends a request with the log dirs and session of this api (unless given)"""
+        kwargs.setdefault('_log_dir_request', self.request_data_dir)
+        kwargs.setdefault('_log_dir_response', self.response_data_dir)
+        if kwargs.get('session') is None:
+            kwargs['session'] = self.session
+        return request_func(url, **kwargs)
 
     @classmethod
-    def _get_log_response_file_path(cls, directory, transact_id):
-        """creates the final file path for response logs"""
+    def _get_log_file_path(cls, directory, transact_id):
+        """creates the final file path for request and response logs"""
         return cls._format_log_file_path.format(directory=directory, transaction_id=transact_id)
 
     @classmethod
     def _get_next_id_from_counter(cls, id_frmt=None):
         id_frmt = id_frmt or cls._format_counter_id
-        return id_frmt.format(id=cls.transaction_counter.next())
+        with cls._transaction_counter_lock:
+            transaction_number = next(cls.transaction_counter)
+        return id_frmt.format(id=transaction_number)
 
     @classmethod
     def _get_transaction_id_parts(cls):
@@ -100,7 +295,13 @@ class RestfulAPI(object):
     @classmethod
     def _extract_log_kwargs(cls, **kwargs):
         """extracts the log kwargs from request kwargs for use in logging"""
-        log_kwargs = {lk[5:]: kwargs.pop(lk) for lk in cls._log_keys if lk in kwargs.keys()}
+        if cls._log_key_set.isdisjoint(kwargs):
+            # the common case, no log kwargs
+            return {}, kwargs
+        log_kwargs = {}
+        for log_key, log_kwarg in cls._log_key_map:
+            if log_key in kwargs:
+                log_kwargs[log_kwarg] = kwargs.pop(log_key)
         return log_kwargs, kwargs
 
     @classmethod
@@ -118,175 +319,202 @@ class RestfulAPI(object):
         save_response = kwargs.pop('save_response', True)
         dir_request = kwargs.pop('dir_request', cls._cls_request_dir)
         dir_response = kwargs.pop('dir_response', cls._cls_response_dir)
+        streamed = kwargs.pop('streamed', False)
+        if not (save_request or save_response):
+            return
+        if cls.background_transaction_logs and not streamed:
+            # the writer gets a snapshot, the caller is free to use (and change the parsed content of) the response
+            _transaction_log_writer.put(
+                cls._write_transaction_logs, _ResponseSnapshot(response), transact_id, save_request, save_response,
+                dir_request, dir_response)
+        else:
+            cls._write_transaction_logs(response, transact_id, save_request, save_response, dir_request, dir_response)
+
+    @classmethod
+    def _write_transaction_logs(cls, response, transact_id, save_request, save_response, dir_request, dir_response):
+        """writes the request and response logs of a transaction"""
         if save_request:
             try:
-                request_file_path = cls._get_log_request_file_path(dir_request, transact_id)
+                request_file_path = cls._get_log_file_path(dir_request, transact_id)
                 cls._log_request(response, request_file_path)
             except Exception as exc:
-                log.error('Exception logging rest transaction request: id={} exc={} trace...'.format(transact_id, exc),
+                log.error('Exception logging rest transaction request: id=%s exc=%s trace...', transact_id, exc,
                           exc_info=True)
         if save_response:
             try:
-                response_file_path = cls._get_log_response_file_path(dir_response, transact_id)
+                response_file_path = cls._get_log_file_path(dir_response, transact_id)
                 cls._log_response(response, response_file_path)
             except Exception as exc:
-                log.error('Exception logging rest transaction response: id={} exc={} trace...'.format(transact_id, exc),
+                log.error('Exception logging rest transaction response: id=%s exc=%s trace...', transact_id, exc,
                           exc_info=True)
 
+    @staticmethod
+    def flush_transaction_logs():
+        """waits until all the transaction logs are written"""
+        _transaction_log_writer.flush()
+
     @classmethod
     def _log_request(cls, response, request_file_path):
-        """log the request side of a transaction"""
-        if response.request.body:
-            content = response.request.body
-        else:
-            content = response.request.url
+        """log the request side of a transaction, large bodies are logged as a snapshot of their head and tail"""
+        request = response.request
+        has_body = bool(request.body)
+        content = request.body if has_body else request.url
+        if cls._max_logged_body_bytes and isinstance(content, basestring) and \
+                len(content) > cls._max_logged_body_bytes:
+            half = cls._max_logged_body_bytes // 2
+            content = content[:half] + '\n...[truncated {} bytes]...\n'.format(len(content) - 2 * half) + \
+                content[-half:]
         data_file = utils.write_file(request_file_path, content)
-        log.trace('log-request: method={} url={} path={} data={}'.format(
-            response.request.method, response.request.url, data_file, bool(response.request.body)))
+        log.trace('log-request: method=%s url=%s path=%s data=%s', request.method, request.url, data_file, has_body)
 
     @classmethod
     def _log_response(cls, response, response_file_path):
         """log the response side of a transaction"""
+        if not cls.pretty_log_responses:
+            data_file = utils.write_file(response_file_path, response.content) if response.content else None
+            log.trace('log-response: status=%s data=%s', response.status_code, data_file)
+            return
         content = cls._get_content_from_json(response)
         if content is not None:
-            data_file = utils.write_file(response_file_path, json.dumps(content, indent=4))
-            log.trace('log-response: status={} data={}'.format(response.status_code, data_file))
+            data_file = utils.write_file(response_file_path, _dump_log_json(content))
+            log.trace('log-response: status=%s data=%s', response.status_code, data_file)
         else:
-            log.trace('log-response: status={} data=None'.format(response.status_code))
+            log.trace('log-response: status=%s data=None', response.status_code)
+
+    @classmethod
+    def _get_ignored_json_convert_error_re(cls):
+        """compiles (once per class) a regex matching any of the ignored json convert error messages"""
+        error_re = cls.__dict__.get('_ignored_json_convert_error_re')
+        if error_re is None:
+            error_re = re.compile('|'.join(map(re.escape, cls._ignored_json_convert_error_messages)))
+            cls._ignored_json_convert_error_re = error_re
+        return error_re
 
     @classmethod
     def _get_content_from_json(cls, response):
-        """attempts to extract content from a json in the response from server"""
+        """
+        attempts to extract content from a json in the response from server
+        the content is kept on the response, so logging and using the response parse it only once
+        every caller gets that same object, so a caller which changes it must take a copy first
+        """
+        try:
+            return response._rest_content
+        except AttributeError:
+            pass
         try:
             content = response.json()
         except ValueError as vexc:
-            if not any([ignored_msg in str(vexc) for ignored_msg in cls._ignored_json_convert_error_messages]):
+            if not cls._get_ignored_json_convert_error_re().search(str(vexc)):
                 raise
             elif response.content:
                 content = response.content
             else:
                 content = None
+        response._rest_content = content
         return content
 
     @classmethod
-    def _request_get(cls, url, **kwargs):
-        """sends a GET command using requests package"""
-        ignore_request_timeout = kwargs.pop('ignore_request_timeout', False)
-        ignore_connection_aborted = kwargs.pop('ignore_connection_aborted', False)
-        log_action = kwargs.pop('log_action', True)
-        session = kwargs.pop('session', None)
+    def _prepare_request(cls, kwargs):
+        """
+        splits the kwargs of a request into the request options, the log kwargs and the kwargs for requests package
+        :param kwargs: the kwargs of the request
+        :return: (options, log_kwargs, kwargs)
+        """
+        options = {name: kwargs.pop(name, default) for name, default in cls._request_option_defaults}
         kwargs.setdefault('timeout', cls.request_timeout)
         log_kwargs, kwargs = cls._extract_log_kwargs(**kwargs)
-        if log_action:
-            log.debug('request.get: url={}'.format(url))
+        return options, log_kwargs, kwargs
+
+    @classmethod
+    def _do_request(cls, method, url, **kwargs):
+        """sends a request using requests package, method is the lowercase http method (get, post, put, delete)"""
+        options, log_kwargs, kwargs = cls._prepare_request(kwargs)
+        import requests
+        if options['log_action']:
+            log.debug('request.%s: url=%s', method, url)
+        session = options['session'] or cls._get_shared_session()
         try:
-            if session:
-                r = session.get(url, **kwargs)
-            else:
-                r = requests.get(url, **kwargs)
+            r = session.request(method.upper(), url, **kwargs)
         except requests.ReadTimeout as exc:
-            if ignore_request_timeout:
-                log.debug('Requests Timeout, ignored: url={} exc={}'.format(url, exc))
+            if options['ignore_request_timeout']:
+                log.debug('Requests Timeout, ignored: url=%s exc=%s', url, exc)
             else:
                 raise
         except requests.ConnectionError as exc:
-            if ignore_connection_aborted and 'Connection aborted.' in str(exc):
-                log.debug('Connection Aborted, ignored: url={} exc={}'.format(url, exc))
+            if options['ignore_connection_aborted'] and _exception_mentions(exc, _connection_aborted_message):
+                log.debug('Connection Aborted, ignored: url=%s exc=%s', url, exc)
             else:
                 raise
         except requests.RequestException as exc:
-            log.error('requests get exception: exc={} url={}'.format(exc, url))
+            log.error('requests %s exception: exc=%s url=%s', method, exc, url)
             raise
         else:
-            cls._log_transaction(r, **log_kwargs)
+            # a streamed response is logged right away, the caller reads its content after this returns
+            cls._log_transaction(r, streamed=kwargs.get('stream', False), **log_kwargs)
             return r
 
+    @classmethod
+    def _request_get(cls, url, **kwargs):
+        """sends a GET command using requests package"""
+        return cls._do_request('get', url, **kwargs)
+
     def request_get(self, url, **kwargs):
         """sends a GET command using requests package"""
-        self.__add_default_log_dirs_to_kwargs(kwargs)
-        kwargs.setdefault('session', self.session)
-        return self._request_get(url, **kwargs)
+        return self._request_with_defaults(self._request_get, url, kwargs)
 
     @classmethod
     def _request_post(cls, url, **kwargs):
         """sends a POST command using requests package"""
-        log_action = kwargs.pop('log_action', True)
-        session = kwargs.pop('session', None)
-        kwargs.setdefault('timeout', cls.request_timeout)
-        log_kwargs, kwargs = cls._extract_log_kwargs(**kwargs)
-        if log_action:
-            log.debug('request.post: url={}'.format(url))
-        try:
-            if session:
-                r = session.post(url, **kwargs)
-            else:
-                r = requests.post(url, **kwargs)
-        except requests.RequestException as exc:
-            log.error('requests post exception: exc={} url={}'.format(exc, url))
-            raise
-        else:
-            cls._log_transaction(r, **log_kwargs)
-        return r
+        return cls._do_request('post', url, **kwargs)
 
     def request_post(self, url, **kwargs):
         """sends a POST command using requests package"""
-        self.__add_default_log_dirs_to_kwargs(kwargs)
-        kwargs.setdefault('session', self.session)
-        return self._request_post(url, **kwargs)
+        return self._request_with_defaults(self._request_post, url, kwargs)
 
     @classmethod
     def _request_put(cls, url, **kwargs):
         """sends a PUT command using requests package"""
-        log_action = kwargs.pop('log_action', True)
-        session = kwargs.pop('session', None)
-        kwargs.setdefault('timeout', cls.request_timeout)
-        log_kwargs, kwargs = cls._extract_log_kwargs(**kwargs)
-        if log_action:
-            log.debug('request.put: url={}'.format(url))
-        try:
-            if session:
-                r = session.put(url, **kwargs)
-            else:
-                r = requests.put(url, **kwargs)
-        except requests.RequestException as exc:
-            log.error('requests put exception: exc={} url={}'.format(exc, url))
-            raise
-        else:
-            cls._log_transaction(r, **log_kwargs)
-        return r
+        return cls._do_request('put', url, **kwargs)
 
     def request_put(self, url, **kwargs):
         """sends a PUT command using requests package"""
-        self.__add_default_log_dirs_to_kwargs(kwargs)
-        kwargs.setdefault('session', self.session)
-        return self._request_put(url, **kwargs)
+        return self._request_with_defaults(self._request_put, url, kwargs)
 
     @classmethod
     def _request_delete(cls, url, **kwargs):
         """sends a DELETE command using requests package"""
-        log_action = kwargs.pop('log_action', True)
-        session = kwargs.pop('session', None)
-        kwargs.setdefault('timeout', cls.request_timeout)
-        log_kwargs, kwargs = cls._extract_log_kwargs(**kwargs)
-        if log_action:
-            log.debug('request.delete: url={}'.format(url))
-        try:
-            if session:
-                r = session.delete(url, **kwargs)
-            else:
-                r = requests.delete(url, **kwargs)
-        except requests.RequestException as exc:
-            log.error('requests delete exception: exc={} url={}'.format(exc, url))
-            raise
-        else:
-            cls._log_transaction(r, **log_kwargs)
-        return r
+        return cls._do_request('delete', url, **kwargs)
 
     def request_delete(self, url, **kwargs):
         """sends a DELETE command using requests package"""
-        self.__add_default_log_dirs_to_kwargs(kwargs)
-        kwargs.setdefault('session', self.session)
-        return self._request_delete(url, **kwargs)
+        return self._request_with_defaults(self._request_delete, url, kwargs)
+
+    def request_many(self, method, urls, **kwargs):
+        """
+        sends the same kind of request to many urls concurrently, sharing the session (and its pooled connections)
+        :param method: the http method (get, post, put, delete)
+        :param urls: the urls to send the requests to
+        :param kwargs: max_workers (default session_pool_maxsize), the rest are kwargs for every request
+        :return: a list of the responses (or the exceptions raised) in the order of the urls
+        """
+        request_func = getattr(self, 'request_{}'.format(method.lower()))
+        urls = list(urls)
+        if not urls:
+            return []
+        max_workers = min(kwargs.pop('max_workers', self.session_pool_maxsize), len(urls))
+        results = [None] * len(urls)
+        self.session  # create the session before the workers share it
+
+        def request(url_index):
+            try:
+                results[url_index] = request_func(urls[url_index], **kwargs)
+            except Exception as exc:
+                results[url_index] = exc
+
+        pool = ThreadPool(max_workers, name='{}-request'.format(self.name))
+        pool.map(request, xrange(len(urls)))
+        pool.shutdown()
+        return results
 
 
 class JsonRestObject(RestfulAPI):
@@ -317,7 +545,8 @@ class JsonRestObject(RestfulAPI):
             return
         content = self._get_content_from_json(response)
         if force_update or (content and isinstance(content, dict)):
-            self.update_data(content)
+            # load_data changes what it loads (defaults, nested structures), keep the parsed content as received
+            self.update_data(copy.deepcopy(content))
 
     def _request_and_update(self, method, url, **kwargs):
         """make a request to a URL, and then load the response into the underlying data json structure"""
@@ -2,11 +2,17 @@
 
 #  Standard Imports
 import time
-from collections import OrderedDict
-from threading import Thread
+import hashlib
+import cPickle
+import weakref
+import itertools
+import multiprocessing
+from collections import OrderedDict, deque
+from threading import Thread, Event, RLock, current_thread
 
 # irtools Imports
 from irtools import *
+from thread_pool import ThreadPool
 
 log = logging.getLogger('irtools.kits.taskmanager')
 
@@ -33,9 +39,27 @@ class MissingTaskReferenceException(TaskManagerException):
 
 class AbstractTask(object):
 
+    # tasks are created in large numbers, slots keep them small (the concrete task classes declare no __slots__,
+    # so their instances still get a __dict__ and accept extra attributes)
+    __slots__ = (
+        # parameters
+        'name', 'func', 'fargs', 'fkwargs',
+        # optional parameters
+        'timeout', 'kill_callback', 'ret_validation', '_run_as_daemon', 'announce_as_trace', 'kwargs',
+        # runtime variables
+        'start_time', 'end_time', 'elapsed_time', 'deadline', 'was_run', '_operating', '_triggered', '_finished',
+        'thread', 'result_digest',
+        # members
+        '_task_manager_ref', '_log_display', 'ret', 'messages',
+    )
+
     msg_starting = 'Task starting'
     msg_finishing = 'Task finishing'
     msg_func_exception = 'Task Func Exception'
+    msg_cached_ret = 'Task ret taken from the result cache'
+
+    # announcement format (announcement, log_display, kwargs)
+    _format_announcement = '%s: %s %s'
 
     def __init__(self, name, func, fargs=None, fkwargs=None, **kwargs):
         """
@@ -46,8 +70,8 @@ class AbstractTask(object):
         :param fkwargs:
         :param kwargs:
         """
-        # fix None fargs and fkwargs as empty list/dict
-        fargs = fargs or []
+        # fix None fargs and fkwargs as empty tuple/dict (the empty tuple is immutable so it is shared by all tasks)
+        fargs = fargs or ()
         fkwargs = fkwargs or {}
 
         # verify critical params
@@ -72,24 +96,31 @@ class AbstractTask(object):
             assert callable(self.ret_validation)
         self._run_as_daemon = kwargs.pop('run_as_daemon', True)
         self.announce_as_trace = kwargs.pop('announce_as_trace', False)
+        max_messages = kwargs.pop('max_messages', 128)
+        keep_messages = kwargs.pop('keep_messages', True)
 
         # store extra kwargs
         self.kwargs = kwargs
 
+        # members that get updated later
+        self._task_manager_ref = None  # weak, see task_manager
+        self._log_display = None  # cached, see log_display
+
         # runtime variables
         self.start_time = 0
         self.end_time = 0
         self.elapsed_time = 0
+        self.deadline = None  # set when the task starts, None when there is no timeout
         self.was_run = False
-        self.operating = False
-        self.triggered = False  # flag for manager to use
-        self.finished = False
+        self._operating = False
+        self._triggered = False  # flag for manager to use
+        self._finished = False
         self.thread = None
+        self.result_digest = None  # set by a manager with a result cache, see _prepare_result_digests
 
         # members that get updated later
-        self.task_manager = None
         self.ret = None
-        self.messages = []
+        self.messages = _make_messages(keep_messages, max_messages)
 
     def attach_manager(self, task_manager):
         """
@@ -99,6 +130,54 @@ class AbstractTask(object):
         :return:
         """
         self.task_manager = task_manager
+        self._log_display = None
+
+    @property
+    def task_manager(self):
+        """
+        the TaskManager managing this Task (None if there is none, or it no longer exists)
+        only a weak reference is kept, the manager holds its tasks so a strong one would make a reference cycle
+        """
+        if self._task_manager_ref is None:
+            return None
+        return self._task_manager_ref()
+
+    @task_manager.setter
+    def task_manager(self, task_manager):
+        self._task_manager_ref = weakref.ref(task_manager) if task_manager is not None else None
+
+    def _state_changed(self):
+        """let the task manager re-index this task after one of its state flags changed"""
+        task_manager = self.task_manager
+        if task_manager is not None:
+            task_manager._index_task(self)
+
+    @property
+    def operating(self):
+        return self._operating
+
+    @operating.setter
+    def operating(self, value):
+        self._operating = value
+        self._state_changed()
+
+    @property
+    def triggered(self):
+        return self._triggered
+
+    @triggered.setter
+    def triggered(self, value):
+        self._triggered = value
+        self._state_changed()
+
+    @property
+    def finished(self):
+        return self._finished
+
+    @finished.setter
+    def finished(self, value):
+        self._finished = value
+        self._state_changed()
 
     def _to_json(self):
         """
@@ -118,42 +197,48 @@ class AbstractTask(object):
             'operating': self.operating,
             'finished': self.finished,
             # members
-            'messages': self.messages,
+            'messages': list(self.messages or ()),
         }
 
-    def check_timeout(self):
-        """
-        Checks if this task has reached it's timeout.
-        :return:
-        """
-        if self.start_time == 0:
-            # task not started yet
-            return False
-
+    @property
+    def effective_timeout(self):
+        """the timeout of this task, or the manager default timeout if it has none (0 means no timeout)"""
         # convert timeout to int / converts False to 0
         timeout = int(self.timeout)
 
-        if not timeout and self.task_manager:
+        task_manager = self.task_manager
+        if not timeout and task_manager:
             # check if there is a default timeout if our timeout is 0/False
-            timeout = self.task_manager.default_task_timeout
+            timeout = task_manager.default_task_timeout
 
-        if not timeout:
-            # there is no timeout possible for this task
+        return timeout or 0
+
+    def check_timeout(self, now=None):
+        """
+        Checks if this task has reached it's timeout.
+        :param now: the current time, lets a caller checking many tasks get the time once
+        :return:
+        """
+        if self.deadline is None:
+            # task not started yet, or there is no timeout possible for this task
             return False
 
-        # get the elapsed time and compare to timeout
-        self.elapsed_time = time.time() - self.start_time
-        return bool(self.elapsed_time > timeout)
+        # get the elapsed time and compare to the deadline computed at start
+        now = now or time.time()
+        self.elapsed_time = now - self.start_time
+        return bool(now > self.deadline)
 
     def kill_task(self):
         """
         attempts to kill this task
         :return:
         """
-        if self.kill_callback is not None and callable(self.kill_callback):
+        # the callbacks are verified callable when they are given
+        task_manager = self.task_manager
+        if self.kill_callback is not None:
             r = self.kill_callback(self)
-        elif self.task_manager and callable(self.task_manager.default_kill_callback):
-            r = self.task_manager.default_kill_callback(self)
+        elif task_manager and task_manager.default_kill_callback is not None:
+            r = task_manager.default_kill_callback(self)
         else:
             r = None
         # todo: finish handling?
@@ -167,8 +252,9 @@ class AbstractTask(object):
         """
         if self._run_as_daemon:
             return True
-        elif self.task_manager:
-            return self.task_manager.run_tasks_as_daemons
+        task_manager = self.task_manager
+        if task_manager:
+            return task_manager.run_tasks_as_daemons
         else:
             return False
 
@@ -182,6 +268,13 @@ class AbstractTask(object):
         self.triggered = True
         if self.operating:
             raise TaskException('Task already operating', self)
+        # the pool workers are daemon threads, a task that must not be a daemon gets its own thread
+        task_manager = self.task_manager
+        pool = task_manager._get_task_pool() if task_manager and self.run_as_daemon else None
+        if pool is not None:
+            # reuse the manager's bounded workers instead of spawning a thread per task
+            pool.add_task(self.go_wait, dry_run)
+            return
         t = Thread(target=self.go_wait, args=[dry_run])
         if self.run_as_daemon:
             t.daemon = True
@@ -197,6 +290,8 @@ class AbstractTask(object):
         self.operating = True
         self.was_run = True
         self.start_time = time.time()
+        timeout = self.effective_timeout
+        self.deadline = self.start_time + timeout if timeout else None
 
     def _finish(self):
         """
@@ -204,7 +299,7 @@ class AbstractTask(object):
         :return:
         """
         self.end_time = time.time()
-        self.elapsed_time = int(self.end_time - self.start_time)
+        self.elapsed_time = self.end_time - self.start_time
         self.operating = False
         self.finished = True
         self._announce_finishing()
@@ -215,7 +310,7 @@ class AbstractTask(object):
         how we announce that we are finished with a task
         :return:
         """
-        self.announce(log.info, self.msg_finishing, time=self.elapsed_time)
+        self.announce(log.info, self.msg_finishing, time='%.3f' % self.elapsed_time)
 
     def _report_task_finished_to_manager(self):
         """
@@ -223,7 +318,10 @@ class AbstractTask(object):
         the task manager may do something with this information
         :return:
         """
-        self.task_manager.handle_task_reports_finished(self)
+        task_manager = self.task_manager
+        # None when there is no manager, or it was garbage collected while this task ran (it is weakly referenced)
+        if task_manager is not None:
+            task_manager.handle_task_reports_finished(self)
 
     def go_wait(self, dry_run=False):
         """
@@ -231,19 +329,57 @@ class AbstractTask(object):
         Runs the function and checks rc and makes announcements, handles cleanup and exceptions
         """
         self.triggered = True
+        self.thread = current_thread()
         self._start()
         try:
             if not dry_run:
-                ret = self.trigger_func()
+                ret, ret_from_cache = self._trigger_func_or_get_cached_ret()
             else:
                 return None
         except Exception as exc:
             self.handle_func_exception(exc)
         else:
             self.validate_ret(ret)
+            if not ret_from_cache:
+                self._store_cached_ret(ret)
         finally:
+            # no return in here, that would swallow any exception (even SystemExit / KeyboardInterrupt)
             self._finish()
-            return self.ret
+        return self.ret
+
+    def _get_result_cache(self):
+        """the result cache of the task manager, None if there is none or this task has no digest"""
+        task_manager = self.task_manager
+        if task_manager is None or self.result_digest is None:
+            return None
+        return task_manager.result_cache
+
+    def _trigger_func_or_get_cached_ret(self):
+        """
+        takes the ret from the result cache when an identical task (and chain of required tasks) already ran,
+        otherwise triggers the func
+        :return: (ret, True if the ret came from the cache)
+        """
+        cache = self._get_result_cache()
+        if cache is not None:
+            try:
+                ret = cache[self.result_digest]
+            except KeyError:
+                pass
+            else:
+                self.announce(log.info, self.msg_cached_ret, digest=self.result_digest)
+                return ret, True
+        return self.trigger_func(), False
+
+    def _store_cached_ret(self, ret):
+        """stores a (validated) ret in the result cache"""
+        cache = self._get_result_cache()
+        if cache is not None and self._ret_is_cacheable():
+            cache[self.result_digest] = ret
+
+    def _ret_is_cacheable(self):
+        """should the ret of this run be stored in the result cache"""
+        return True
 
     def trigger_func(self):
         """this is the actual function that the task triggers"""
@@ -263,7 +399,7 @@ class AbstractTask(object):
         :param ret: the ret returned by the func
         :return:
         """
-        if self.ret_validation is not None and callable(self.ret_validation):
+        if self.ret_validation is not None:
             ret = self.ret_validation(ret)
         self.ret = ret
         return self.ret
@@ -278,16 +414,14 @@ class AbstractTask(object):
         :return:
         """
         # make the message
-        message = '{announcement}: {task} {kwargs}'.format(
-            announcement=announcement,
-            task=self.log_display,
-            kwargs=' '.join(sorted(utils.convert_dict_params_to_list_of_string(kwargs)))
-        )
+        message = self._format_announcement % (announcement, self.log_display, _format_announcement_kwargs(kwargs))
         # store the message
-        self.messages.append(message)
+        if self.messages is not None:
+            self.messages.append(message)
 
         # override the log function if needed
-        if self.announce_as_trace or self.task_manager and self.task_manager.tasks_announce_trace:
+        task_manager = self.task_manager
+        if self.announce_as_trace or task_manager and task_manager.tasks_announce_trace:
             logfunc = log.trace
 
         # add "trace..." to message when logging execution trace
@@ -301,10 +435,18 @@ class AbstractTask(object):
     def log_display(self):
         """
         How we should display this task in the log messages (announcements)
+        built once and cached, it is reset when a manager is attached
         :return:
         """
-        if self.task_manager:
-            return "Task(name='{}' manager='{}')".format(self.name, self.task_manager.name)
+        if self._log_display is None:
+            self._log_display = self._make_log_display()
+        return self._log_display
+
+    def _make_log_display(self):
+        """builds the log display of this task"""
+        task_manager = self.task_manager
+        if task_manager:
+            return "Task(name='{}' manager='{}')".format(self.name, task_manager.name)
         else:
             return "Task(name='{}')".format(self.name)
 
@@ -333,6 +475,9 @@ class RCTask(AbstractTask):
         True: 0,
         False: 0,
     }
+    # the replaceable ret values above that are compared with "==", collected once per class
+    # (see _get_replaceable_equal_ret_values)
+    _replaceable_equal_ret_values = None
 
     msg_replace_ret = 'Task got bad ret, ignoring and replacing'
     msg_invalid_rc = 'Task got invalid rc'
@@ -349,7 +494,7 @@ class RCTask(AbstractTask):
         announce the task is finishing, and include rc
         :return:
         """
-        self.announce(log.info, self.msg_finishing, time=self.elapsed_time, rc=self.rc)
+        self.announce(log.info, self.msg_finishing, time='%.3f' % self.elapsed_time, rc=self.rc)
 
     def validate_ret(self, ret):
         """
@@ -374,7 +519,12 @@ class RCTask(AbstractTask):
         # for None, True, False replaceable values we need to verify with identity "is"
         # for other replaceable values (possibly in the future) we use eq "=="
         # this prevents 1 or 0 from being converted because 0==False and 1==True
-        if any(((ret is v) if utils.is_bool_or_none(v) else ret == v) for v in self.replaceable_ret_values):
+        if ret is None or ret is True or ret is False:
+            replace = ret in self.replaceable_ret_values
+        else:
+            equal_values = self._get_replaceable_equal_ret_values()
+            replace = bool(equal_values) and any(ret == v for v in equal_values)
+        if replace:
             rc = self.replaceable_ret_values.get(ret)
             self.announce(log.warn, self.msg_replace_ret, ret=ret, rc=rc)
         elif hasattr(ret, 'rc'):
@@ -383,6 +533,15 @@ class RCTask(AbstractTask):
             rc = ret
         return rc
 
+    @classmethod
+    def _get_replaceable_equal_ret_values(cls):
+        """collects (once per class) the replaceable ret values which are not None, True or False"""
+        equal_values = cls.__dict__.get('_replaceable_equal_ret_values')
+        if equal_values is None:
+            equal_values = tuple(v for v in cls.replaceable_ret_values if not utils.is_bool_or_none(v))
+            cls._replaceable_equal_ret_values = equal_values
+        return equal_values
+
     def validate_rc(self, rc):
         """
         validates the rc returned from the func call
@@ -400,6 +559,10 @@ class RCTask(AbstractTask):
             # if it is not a good rc we need to handle it
             self.handle_bad_rc(rc)
 
+    def _ret_is_cacheable(self):
+        """only rets with a good rc are cached, so bad runs are retried"""
+        return not self.got_bad_rc
+
     def handle_bad_rc(self, rc):
         """
         how we handle a bad rc returned from the func call
@@ -423,7 +586,7 @@ class OrderedTask(RCTask):
     def __init__(self, name, func, fargs=None, fkwargs=None, **kwargs):
         # parameters
         reqs = kwargs.pop('reqs', None)
-        if isinstance(reqs, (list, set, tuple)):
+        if isinstance(reqs, (list, set, frozenset, tuple)):
             self.reqs = set(reqs)
         elif isinstance(reqs, str):
             self.reqs = set(reqs.split())
@@ -436,7 +599,7 @@ class OrderedTask(RCTask):
         self.active = kwargs.pop('active', True)
 
         # runtime variables
-        self.next_tasks = set()  # for debugging and logging, not used for flow logic
+        self.next_tasks = set()  # reverse of reqs, linked by the manager (see link_next_tasks)
 
         # super
         super(OrderedTask, self).__init__(name, func, fargs, fkwargs, **kwargs)
@@ -452,6 +615,12 @@ class AbstractTaskManager(object):
     msg_finishing = 'TaskManager finishing'
     msg_tasks_still_running = 'TaskManager still has running tasks'
 
+    # announcement format (announcement, log_display, kwargs)
+    _format_announcement = '%s: %s %s'
+
+    # longest time the operating loop sleeps without being woken, also the spacing of throttled task starts
+    operating_loop_period = 1
+
     def __init__(self, name, **kwargs):
         # store parameters
         self.name = name
@@ -460,12 +629,20 @@ class AbstractTaskManager(object):
         self.dry_run = kwargs.pop('dry_run', False)
         self.default_task_timeout = kwargs.pop('default_task_timeout', 3600)
         self.default_kill_callback = kwargs.pop('default_kill_callback', utils.noop)
+        if self.default_kill_callback is not None:
+            assert callable(self.default_kill_callback)
         self.tasks_announce_trace = kwargs.pop('tasks_announce_trace', False)
         self.announce_as_trace = kwargs.pop('announce_as_trace', False)
         self.run_tasks_as_daemons = kwargs.pop('run_tasks_as_daemons', False)
         self.stop_running_tasks_on_halt = kwargs.pop('stop_running_tasks_on_halt', False)
         self.report_still_running_tasks = kwargs.pop('report_still_running_tasks', True)
         self.task_throttle = kwargs.pop('task_throttle', False)
+        # any dict-like (e.g. a dict, or a shelve for results that persist across runs)
+        self.result_cache = kwargs.pop('cache_backend', None)
+        max_messages = kwargs.pop('max_messages', 128)
+        keep_messages = kwargs.pop('keep_messages', True)
+        self.max_workers = kwargs.pop('max_workers', None) or min(32, multiprocessing.cpu_count() * 4)
+        self.num_task_pools = kwargs.pop('num_task_pools', 1)
 
         # store extra kwargs
         self.kwargs = kwargs
@@ -476,10 +653,23 @@ class AbstractTaskManager(object):
         self.finished = False
         self.start_time = 0
         self.end_time = 0
+        self._throttled_batch = []
+        self._wake = Event()  # set by finishing tasks to wake the operating loop early
+
+        # task state index, kept up to date by the tasks so the operating loop never rescans all tasks
+        self._index_lock = RLock()
+        self._ready_task_names = set()
+        self._started_task_names = set()
+        self._running_task_names = set()
+        self._finished_task_names = set()
 
         # members
         self.tasks = OrderedDict()
-        self.messages = []
+        self._last_task_name = None
+        self.messages = _make_messages(keep_messages, max_messages)
+        self._log_display = None  # cached, see log_display
+        self.task_pools = []  # created when operating starts, see _start_task_pool
+        self._task_pool_cycle = None
 
     def announce(self, logfunc, announcement, exc_info=False, **kwargs):
         """
@@ -491,13 +681,10 @@ class AbstractTaskManager(object):
         :return:
         """
         # make the message
-        message = '{announcement}: {taskmanager} {kwargs}'.format(
-            announcement=announcement,
-            taskmanager=self.log_display,
-            kwargs=' '.join(sorted(utils.convert_dict_params_to_list_of_string(kwargs)))
-        )
+        message = self._format_announcement % (announcement, self.log_display, _format_announcement_kwargs(kwargs))
         # store the message
-        self.messages.append(message)
+        if self.messages is not None:
+            self.messages.append(message)
 
         # override the log function if needed
         if self.announce_as_trace:
@@ -514,8 +701,15 @@ class AbstractTaskManager(object):
     def log_display(self):
         """
         How we should display this TaskManager in the log messages (announcements)
+        built once and cached
         :return:
         """
+        if self._log_display is None:
+            self._log_display = self._make_log_display()
+        return self._log_display
+
+    def _make_log_display(self):
+        """builds the log display of this TaskManager"""
         return "TaskManager(name='{}')".format(self.name)
 
     def __str__(self):
@@ -528,18 +722,66 @@ class AbstractTaskManager(object):
         will attach this TaskManger to the Task
         :param task: Task object to add to this TaskManager
         """
-        if task.name in self.tasks.keys():
+        if task.name in self.tasks:
             self.announce(log.error, self.msg_duplicate_task_name, name=task.name)
             raise DuplicateTaskException(task.name)
         task.attach_manager(self)
         self.tasks[task.name] = task
+        self._last_task_name = task.name
+        self._register_task(task)
+
+    def _register_task(self, task):
+        """add a task to the state index"""
+        self._index_task(task)
+
+    def _reindex_tasks(self):
+        """rebuild the state index from scratch (after the workflow was changed)"""
+        with self._index_lock:
+            self._ready_task_names.clear()
+            self._started_task_names.clear()
+            self._running_task_names.clear()
+            self._finished_task_names.clear()
+            for task in self.tasks.values():
+                self._register_task(task)
+
+    def _index_task(self, task):
+        """update the state index for a task, called by the task whenever one of its state flags changes"""
+        task_name = task.name
+        if self.tasks.get(task_name) is not task:
+            return  # not (yet) one of our tasks
+        with self._index_lock:
+            _set_membership(self._started_task_names, task_name, task.triggered)
+            _set_membership(self._running_task_names, task_name, task.operating)
+            if task.finished and task_name not in self._finished_task_names:
+                self._finished_task_names.add(task_name)
+                self._handle_indexed_task_finished(task)
+            elif not task.finished and task_name in self._finished_task_names:
+                self._finished_task_names.discard(task_name)
+                self._handle_indexed_task_unfinished(task)
+            self._update_ready_index(task)
+
+    def _update_ready_index(self, task):
+        """add or remove a task from the ready index"""
+        _set_membership(self._ready_task_names, task.name, self._is_task_ready(task))
+
+    def _is_task_ready(self, task):
+        """checks if a task is ready to operate"""
+        # there is some overlap on these conditions, provided here to ensure that we don't run tasks twice
+        return not (task.triggered or task.operating or task.finished)
+
+    def _handle_indexed_task_finished(self, task):
+        """called (under the index lock) when a task becomes finished"""
+        pass
+
+    def _handle_indexed_task_unfinished(self, task):
+        """called (under the index lock) when a finished task is marked not finished again"""
+        pass
 
     def get_last_added_task(self):
         """Get the task that was last added to this TaskManager"""
-        if not self.tasks.keys():
+        if not self.tasks:
             raise ValueError('No tasks yet')
-        last_task_key = self.tasks.keys()[-1]
-        return self.tasks[last_task_key]
+        return self.tasks[self._last_task_name]
 
     @utils.run_async
     def go_no_wait(self):
@@ -556,6 +798,7 @@ class AbstractTaskManager(object):
     def go(self):
         """Trigger the TaskManager, this is the main way to start a TaskManager"""
         self._prepare()
+        self._prepare_result_digests()
         self._start()
         try:
             self._operating_loop()
@@ -566,9 +809,75 @@ class AbstractTaskManager(object):
         """triggered when we want to start operating, before we actually start anything"""
         pass
 
+    def _prepare_result_digests(self):
+        """
+        when there is a result cache, give each task a digest of its name, func, arguments and required tasks
+        identical tasks (with identical chains of required tasks) will share a digest, and so a cached ret
+        tasks whose arguments cannot be pickled get no digest and are never cached
+        tasks in a cycle of requirements (and the tasks requiring them) get no digest either
+        """
+        if self.result_cache is None:
+            return
+        digests = {}
+        in_progress = set()  # walked into, waiting for their required tasks (still on the stack)
+        for task_name, task in self._iter_tasks():
+            # iterative post-order walk so required tasks get their digest first (no recursion limit on long chains)
+            stack = [task]
+            while stack:
+                current = stack[-1]
+                name = current.name
+                if name in digests:
+                    stack.pop()
+                    continue
+                if name in in_progress:
+                    # walked back to after its required tasks got their digests
+                    stack.pop()
+                    digests[name] = self._make_result_digest(current, digests)
+                    continue
+                pending = [t for t in self._get_required_task_names(current) if t not in digests]
+                if in_progress.intersection(pending):
+                    # requires a task that is still waiting on this one, a cycle
+                    stack.pop()
+                    digests[name] = None
+                    continue
+                in_progress.add(name)
+                stack.extend(self.tasks[t] for t in pending)
+            task.result_digest = digests[task_name]
+
+    def _get_required_task_names(self, task):
+        """the names of the tasks whose results this task depends on"""
+        return ()
+
+    def _make_result_digest(self, task, digests):
+        """makes the result digest of one task, from the digests of its required tasks"""
+        required_digests = [digests[t] for t in sorted(self._get_required_task_names(task))]
+        if None in required_digests:
+            return None
+        try:
+            identity = cPickle.dumps((task.name, self._get_func_identity(task.func), tuple(task.fargs),
+                                      sorted(task.fkwargs.items()), required_digests), 2)
+        except Exception:
+            return None
+        return hashlib.sha256(identity).hexdigest()
+
+    @staticmethod
+    def _get_func_identity(func):
+        """
+        identifies a func for the result digest, its name alone is shared by different funcs
+        module, name and code location (there is no __qualname__), and the object a method is bound to
+        """
+        bound_to = getattr(func, 'im_self', None)
+        func = getattr(func, 'im_func', func)
+        name = getattr(func, '__name__', None)
+        code = getattr(func, 'func_code', None)
+        location = (code.co_filename, code.co_firstlineno) if code is not None else None
+        # a callable object has no name, it is identified by itself (pickled)
+        return getattr(func, '__module__', None), name, location, bound_to if name else func
+
     def _start(self):
         """triggered when operating loop begins"""
         self._announce_starting()
+        self._start_task_pool()
         self.start_time = time.time()
         self.operating = True
 
@@ -580,9 +889,40 @@ class AbstractTaskManager(object):
         """triggered when operating loop finished"""
         self.end_time = time.time()
         self.operating = False
+        self._stop_task_pool()
         self.finished = True
         self._announce_finishing()
 
+    def _start_task_pool(self):
+        """
+        create the bounded pool of worker threads that runs the tasks
+        the workers may be split into several pools (num_task_pools) each with its own queue, used round-robin
+        """
+        num_workers = max(1, min(self.max_workers, len(self.tasks)))
+        num_pools = max(1, min(self.num_task_pools, num_workers))
+        self.task_pools = [
+            ThreadPool(num_workers // num_pools + (1 if idx < num_workers % num_pools else 0),
+                       name='{}-{}'.format(self.name, idx) if num_pools > 1 else self.name)
+            for idx in xrange(num_pools)
+        ]
+        self._task_pool_cycle = itertools.cycle(self.task_pools)
+
+    def _get_task_pool(self):
+        """gets the pool the next task should run on, None when not operating"""
+        if not self.task_pools:
+            return None
+        return next(self._task_pool_cycle)
+
+    def _stop_task_pool(self):
+        """stop the worker threads"""
+        pools, self.task_pools = self.task_pools, []
+        for pool in pools:
+            pool.stop()
+        if self.all_tasks_finished:
+            # nothing is running anymore so the workers exit right away, wait for them (not when halted)
+            for pool in pools:
+                pool.join()
+
     def _announce_finishing(self):
         """announce the TaskManager is finishing"""
         self.announce(log.info, self.msg_finishing, time=int(self.duration))
@@ -590,6 +930,8 @@ class AbstractTaskManager(object):
     def _operating_loop(self):
         """main operating loop"""
         while self.operating:
+            # clear before checking so that a task finishing mid-iteration wakes the next wait immediately
+            self._wake.clear()
             # check all finished
             if self.all_tasks_finished:
                 break
@@ -600,11 +942,27 @@ class AbstractTaskManager(object):
                 break
             # start new tasks
             self._operating_start_new_tasks()
-            # give some time before iterations
-            time.sleep(1)
+            self._log_duration()
+            # wait until a task finishes, a timeout may be reached, or the period passes
+            self._wake.wait(self._next_wakeup_in())
         else:
             self.handle_operating_loop_halted()
 
+    def _next_wakeup_in(self):
+        """seconds until the operating loop must check again even if no task finished (throttle or task timeout)"""
+        wakeup_in = self.operating_loop_period
+        now = time.time()
+        if self.task_throttle and self._throttled_batch:
+            # wake when the next throttled batch is allowed to start
+            throttle_in = self.operating_loop_period - (now - self._last_throttled_start_time())
+            if throttle_in > 0:
+                wakeup_in = min(wakeup_in, throttle_in)
+        for task_name, task in self._iter_running_tasks():
+            if task.deadline is not None:
+                # check_timeout compares with ">" so wake just after the timeout is reached
+                wakeup_in = min(wakeup_in, task.deadline - now + 0.01)
+        return max(wakeup_in, 0.01)
+
     def _operating_check_conditions(self):
         """check all conditions during operating"""
         self.check_running_tasks_for_timeout()
@@ -615,11 +973,26 @@ class AbstractTaskManager(object):
 
     def _operating_start_new_tasks(self):
         """while operating we should start new tasks when they are ready"""
-        tasks_to_start = sorted(self._get_ready_tasks())
-        if self.task_throttle:
-            tasks_to_start = tasks_to_start[:self.task_throttle]
-        for task_name in tasks_to_start:
-            self.handle_start_new_task(task_name)
+        if not self._ready_task_names:
+            return  # nothing became ready since the last iteration
+        # the whole batch is dispatched under one hold of the index lock,
+        # the tasks re-enter it (cheaply) as they are triggered instead of contending for it one by one
+        with self._index_lock:
+            tasks_to_start = sorted(self._ready_task_names)
+            if self.task_throttle:
+                # a throttled batch may only start a period after the previous batch started, even when woken early
+                if time.time() - self._last_throttled_start_time() < self.operating_loop_period:
+                    return
+                tasks_to_start = tasks_to_start[:self.task_throttle]
+                self._throttled_batch = [self.tasks[task_name] for task_name in tasks_to_start]
+            for task_name in tasks_to_start:
+                self.handle_start_new_task(task_name)
+
+    def _last_throttled_start_time(self):
+        """when the last throttled batch started, tasks still waiting for a worker count as starting now"""
+        if not self._throttled_batch:
+            return 0
+        return max(task.start_time or time.time() for task in self._throttled_batch)
 
     def handle_start_new_task(self, task_name):
         """
@@ -632,8 +1005,9 @@ class AbstractTaskManager(object):
 
     def check_running_tasks_for_timeout(self):
         """checks all running tasks for timeouts"""
+        now = time.time()
         for task_name, task in self._iter_running_tasks():
-            if task.check_timeout():
+            if task.check_timeout(now):
                 self.handle_task_timeout(task)
 
     def handle_task_timeout(self, task):
@@ -645,7 +1019,10 @@ class AbstractTaskManager(object):
 
     def handle_task_reports_finished(self, task):
         """when a task is finished it will call this method"""
-        if self.report_still_running_tasks:
+        self._wake.set()
+        # only gather the running tasks when the (debug or trace) announcement would be logged
+        report_level = logging.TRACE if self.announce_as_trace else logging.DEBUG
+        if self.report_still_running_tasks and log.isEnabledFor(report_level):
             currently_running_tasks = self._get_running_tasks()
             if currently_running_tasks:
                 self._announce_tasks_still_running(currently_running_tasks)
@@ -689,58 +1066,45 @@ class AbstractTaskManager(object):
         for task_name, task in self.tasks.items():
             yield task_name, task
 
+    def _iter_indexed_tasks(self, task_names):
+        """yields the tasks named in one of the state index sets"""
+        with self._index_lock:
+            task_names = list(task_names)  # tasks update the index from their own threads
+        for task_name in task_names:
+            yield task_name, self.tasks[task_name]
+
     def _iter_started_tasks(self):
         """yields all the tasks which are started"""
-        for task_name, task in self._iter_tasks():
-            if not task.triggered:
-                continue
-            yield task_name, task
+        return self._iter_indexed_tasks(self._started_task_names)
 
     def _iter_finished_tasks(self):
         """yields all the tasks which are finished"""
-        for task_name, task in self._iter_tasks():
-            if not task.finished:
-                continue
-            yield task_name, task
+        return self._iter_indexed_tasks(self._finished_task_names)
 
     def _iter_running_tasks(self):
         """yields all the tasks which are currently operating"""
-        for task_name, task in self._iter_tasks():
-            if not task.operating:
-                continue
-            yield task_name, task
+        return self._iter_indexed_tasks(self._running_task_names)
 
     def _iter_ready_tasks(self):
         """yields all the tasks which are ready to operate"""
-        for task_name, task in self._iter_tasks():
-            # we will iterate all the tasks,
-            # and each task which we can detect is not ready we will skip (continue)
-            # that way only the tasks that are ready now will be yielded
-            # there is some overlap on these conditions, provided here to ensure that we don't run tasks twice
-            if task.triggered:
-                continue  # it's already been triggered
-            if task.operating:
-                continue  # it's already running
-            if task.finished:
-                continue  # it's already finished
-            # since we did not skip (continue) then this task must be ready
-            yield task_name, task
+        return self._iter_indexed_tasks(self._ready_task_names)
 
     @property
     def all_tasks_finished(self):
         """checks if all tasks are finished"""
-        return all(task.finished for task in self.tasks.values())
+        return len(self._finished_task_names) == len(self.tasks)
 
     @property
     def duration(self):
         """gets the current duration of the TaskManager since it started, or the final duration if its finished"""
         if not self.start_time:
             return None
-        if not self.end_time:
-            duration = time.time() - self.start_time
-            self.announce(log.trace, self.msg_duration_in_progress, duration=int(duration))
-            return duration
-        return self.end_time - self.start_time
+        return (self.end_time or time.time()) - self.start_time
+
+    def _log_duration(self):
+        """announce (trace) the duration while operating"""
+        if log.isEnabledFor(logging.TRACE):
+            self.announce(log.trace, self.msg_duration_in_progress, duration=int(self.duration))
 
 
 class RCTaskManager(AbstractTaskManager):
@@ -774,12 +1138,15 @@ class RCTaskManager(AbstractTaskManager):
     @property
     def worst_rc(self):
         """returns the worst rc from all the tasks"""
+        rcs = [task.rc for task_name, task in self._iter_tasks()]
+        if not rcs:
+            return 0
         # first lets find if any rc is above 0, if so then we can return it
-        rc = max(self.task_rcs.values())
+        rc = max(rcs)
         if rc > 0:
             return rc
         # if no rc is above 0 we need to check for negative rc, if so then we return it
-        rc = min(self.task_rcs.values())
+        rc = min(rcs)
         if rc < 0:
             return rc
         # if no rc is above or below 0 then that means that the rc is 0 and everything is okay!
@@ -803,10 +1170,17 @@ class OrderedTaskManager(RCTaskManager):
     def __init__(self, name, **kwargs):
         # optional parameters
         self.auto_reqs_from_previous_task = kwargs.pop('auto_reqs_from_previous_task', False)
+        # drop required tasks that are already required through another required task (see reduce_task_workflow)
+        self.reduce_reqs = kwargs.pop('reduce_reqs', False)
 
         # call super
         super(OrderedTaskManager, self).__init__(name, **kwargs)
 
+        # workflow index: task name -> names of its unfinished reqs,
+        # task name -> (task, its unfinished reqs) of the tasks requiring it, so a finish reaches them without lookups
+        self._waiting_reqs = {}
+        self._dependents = {}
+
     @property
     def active_tasks(self):
         return {task_name: task for task_name, task in self.tasks.items() if task.active}
@@ -814,10 +1188,9 @@ class OrderedTaskManager(RCTaskManager):
     @property
     def last_added_task(self):
         """Get the task that was last added to this TaskManager"""
-        if not self.tasks.keys():
+        if not self.tasks:
             raise ValueError('No tasks yet')
-        last_task_key = self.tasks.keys()[-1]
-        return self.tasks[last_task_key]
+        return self.tasks[self._last_task_name]
 
     def add_task(self, task):
         """
@@ -826,7 +1199,7 @@ class OrderedTaskManager(RCTaskManager):
         :return:
         """
         # assert hasattr(task, 'reqs') and isinstance(task.reqs, set)
-        if self.auto_reqs_from_previous_task and self.tasks.keys() and not task.reqs:
+        if self.auto_reqs_from_previous_task and self.tasks and not task.reqs:
             # override with a new set() that has only the last added task
             task.reqs = {self.last_added_task.name}
         return super(OrderedTaskManager, self).add_task(task)
@@ -837,8 +1210,32 @@ class OrderedTaskManager(RCTaskManager):
         :return:
         """
         super(OrderedTaskManager, self)._prepare()
+        self._thaw_workflow()
         self.verify_task_workflow()
+        self.link_next_tasks()
         self.remove_deactivated_tasks()
+        if self.reduce_reqs:
+            self.reduce_task_workflow()
+        self._freeze_workflow()
+        self._reindex_tasks()
+
+    def _get_required_task_names(self, task):
+        """the names of the tasks whose results this task depends on"""
+        return task.reqs
+
+    def _freeze_workflow(self):
+        """the workflow is final once prepared, store the required and next tasks as frozensets"""
+        for task in self.tasks.values():
+            task.reqs = frozenset(task.reqs)
+            task.next_tasks = frozenset(task.next_tasks)
+
+    def _thaw_workflow(self):
+        """make the required and next tasks mutable sets again (so the workflow can be populated again)"""
+        for task in self.tasks.values():
+            if isinstance(task.reqs, frozenset):
+                task.reqs = set(task.reqs)
+            if isinstance(task.next_tasks, frozenset):
+                task.next_tasks = set(task.next_tasks)
 
     def _announce_starting(self):
         """announce the TaskManager is starting"""
@@ -855,47 +1252,122 @@ class OrderedTaskManager(RCTaskManager):
                 continue  # it's deactivated (skip)
             yield task_name, task
 
-    def _iter_ready_tasks(self):
-        """yields all the tasks which are ready to operate"""
-        for task_name, task in super(OrderedTaskManager, self)._iter_ready_tasks():
-            # we will iterate all the tasks,
-            # and each task which we can detect is not ready we will skip (continue)
-            # that way only the tasks that are ready now will be yielded
-            if not all(self.tasks[t].finished for t in task.reqs):
-                continue  # requirements are not finished
-            # since we did not skip (continue) then this task must be ready
+    def _iter_indexed_tasks(self, task_names):
+        """yields the active tasks named in one of the state index sets"""
+        for task_name, task in super(OrderedTaskManager, self)._iter_indexed_tasks(task_names):
+            if not task.active:
+                continue  # it's deactivated (skip)
             yield task_name, task
 
+    def _reindex_tasks(self):
+        """rebuild the state and workflow index from scratch (after the workflow was changed)"""
+        with self._index_lock:
+            self._dependents.clear()
+            self._waiting_reqs.clear()
+            super(OrderedTaskManager, self)._reindex_tasks()
+
+    def _register_task(self, task):
+        """add a task to the state and workflow index"""
+        with self._index_lock:
+            waiting_reqs = self._waiting_reqs[task.name] = set(task.reqs) - self._finished_task_names
+            for req_name in task.reqs:
+                self._dependents.setdefault(req_name, []).append((task, waiting_reqs))
+            super(OrderedTaskManager, self)._register_task(task)
+
+    def _is_task_ready(self, task):
+        """checks if a task is ready to operate, it must be active and all its requirements finished"""
+        if not task.active or self._waiting_reqs.get(task.name):
+            return False
+        return super(OrderedTaskManager, self)._is_task_ready(task)
+
+    def _handle_indexed_task_finished(self, task):
+        """a finished task no longer holds back the tasks requiring it"""
+        for dependent, waiting_reqs in self._dependents.get(task.name, ()):
+            waiting_reqs.discard(task.name)
+            if not waiting_reqs:
+                self._update_ready_index(dependent)
+
+    def _handle_indexed_task_unfinished(self, task):
+        """a task that is no longer finished holds back the tasks requiring it again"""
+        for dependent, waiting_reqs in self._dependents.get(task.name, ()):
+            waiting_reqs.add(task.name)
+            self._ready_task_names.discard(dependent.name)
+
     def remove_deactivated_tasks(self):
         """
         one of the task workflow population functions.
         removes all deactivated tasks from the workflow by marking them as finished
         and adjusting the required tasks of the next tasks (removing the deactivated task)
         and adjusting the next tasks of the required tasks (removing the deactivated task)
+        (relies on the next tasks being linked, see link_next_tasks)
         """
         deactivated_tasks = [task for task in self.tasks.values() if not task.active]
         for deactivated_task in deactivated_tasks:
             deactivated_task.finished = True  # protection from issues
             self._remove_task_and_adjust_neighbors(deactivated_task)
 
+    def link_next_tasks(self):
+        """
+        one of the task workflow population functions.
+        fills the next tasks of every task (the reverse of the required tasks) in a single pass
+        """
+        for task in self.tasks.values():
+            task.next_tasks = set()
+        for task in self.tasks.values():
+            for req_name in task.reqs:
+                rt = self.tasks.get(req_name)
+                if rt is not None:
+                    rt.next_tasks.add(task.name)
+
+    def reduce_task_workflow(self):
+        """
+        one of the task workflow population functions.
+        removes redundant requirements (transitive reduction), a required task is redundant
+        when it is also required (directly or not) by another of the required tasks,
+        for example: if c requires a and b, and b requires a, then c only needs to require b
+        (relies on the next tasks being linked and the deactivated tasks removed)
+        """
+        tasks = self.tasks
+        for task in self.active_tasks.values():
+            if len(task.reqs) < 2:
+                continue  # nothing can be redundant
+            # the ancestors of all the required tasks, only requirements among them may be redundant
+            candidates = task.reqs & self._get_ancestor_task_names(task.reqs)
+            for req_name in sorted(candidates):
+                # check against the remaining requirements, so a cycle of requirements keeps one of its members
+                if req_name in self._get_ancestor_task_names(task.reqs - {req_name}):
+                    task.reqs.discard(req_name)
+                    tasks[req_name].next_tasks.discard(task.name)
+
+    def _get_ancestor_task_names(self, task_names):
+        """the names of all the tasks required (directly or not) by the named tasks"""
+        ancestors = set()
+        stack = [req_name for task_name in task_names for req_name in self.tasks[task_name].reqs]
+        while stack:
+            task_name = stack.pop()
+            if task_name in ancestors:
+                continue
+            ancestors.add(task_name)
+            stack.extend(self.tasks[task_name].reqs)
+        return ancestors
+
     def _remove_task_and_adjust_neighbors(self, task):
         """
         one of the task workflow population functions.
         removes a deactivated tasks from the workflow. usually called internally by "remove_deactivated_tasks"
         adjusting the required tasks of the next tasks (removing the deactivated task)
         adjusting the next tasks of the required tasks (removing the deactivated task)
+        (relies on the next tasks being linked, see link_next_tasks)
         """
         # adjust task requirements for flow logic
-        for nt in (self.tasks[t] for t in task.next_tasks):
+        for nt in [self.tasks[t] for t in task.next_tasks]:
             nt.reqs.update(task.reqs)
-            if task.name in nt.reqs:
-                nt.reqs.remove(task.name)
+            nt.reqs.discard(task.name)
 
-        # adjust next tasks for debugging and logging
-        for rt in (self.tasks[t] for t in task.reqs):
+        # adjust next tasks of the required tasks, so removing them later carries these next tasks along
+        for rt in [self.tasks[t] for t in task.reqs]:
             rt.next_tasks.update(task.next_tasks)
-            if task.name in rt.next_tasks:
-                rt.next_tasks.remove(task.name)
+            rt.next_tasks.discard(task.name)
 
     def verify_task_workflow(self):
         """
@@ -903,8 +1375,12 @@ class OrderedTaskManager(RCTaskManager):
         verifies that all task references exist
         :return:
         """
-        for task in self.tasks.values():
-            missing_task_references = [tr for tr in task.reqs if tr not in self.tasks.keys()]
+        tasks = self.tasks
+        for task in tasks.values():
+            if not task.reqs:
+                continue
+            # set difference against the dict checks each req with a single hash lookup
+            missing_task_references = sorted(task.reqs.difference(tasks))
             if missing_task_references:
                 self.announce(log.error, self.msg_missing_reference, task=task.name, missing=missing_task_references)
                 raise MissingTaskReferenceException(task, missing_task_references)
@@ -943,6 +1419,7 @@ class SubTaskManager(TaskManager):
 
     def attach_manager(self, task_manager):
         self.parent_task_manager = task_manager
+        self._log_display = None
 
     def _operating_check_conditions(self):
         """check all conditions during operating"""
@@ -959,8 +1436,7 @@ class SubTaskManager(TaskManager):
         self.announce(log.error, self.msg_task_fail_rc)
         self.stop_operating = True
 
-    @property
-    def log_display(self):
+    def _make_log_display(self):
         """
         How we should display this SubTaskManager in the log messages (announcements)
         :return:
@@ -969,6 +1445,35 @@ class SubTaskManager(TaskManager):
             self.name, self.parent_task_manager.name if self.parent_task_manager else '')
 
 
+def _format_announcement_kwargs(kwargs):
+    """formats announcement kwargs as sorted "key=value" params, sorting only when there is more than one"""
+    if not kwargs:
+        return ''
+    params = utils.convert_dict_params_to_list_of_string(kwargs)
+    if len(params) == 1:
+        return params[0]
+    return ' '.join(sorted(params))
+
+
+def _make_messages(keep_messages, max_messages):
+    """
+    makes the container announcements are stored in
+    :param keep_messages: if False messages are not stored at all (None)
+    :param max_messages: only the latest messages are kept, None keeps all of them
+    """
+    if not keep_messages:
+        return None
+    return deque(maxlen=max_messages)
+
+
+def _set_membership(names, name, member):
+    """add or remove a name from a set"""
+    if member:
+        names.add(name)
+    else:
+        names.discard(name)
+
+
 # CONVENIENCE task list and taskmanager generators
 
 
@@ -976,8 +1481,11 @@ def simple_task_list_gen(*funcs, **kwargs):
     """generate a list of tasks from a list of functions with no arguments or requirements"""
     indexed = kwargs.pop('indexed', False)
     tasks = []
+    func_names = {}  # a func may be given many times, its name is sanitized once per call
     for idx, func in enumerate(funcs, start=1):
-        func_name = utils.sanitize(utils.get_func_name(func))
+        func_name = func_names.get(func)
+        if func_name is None:
+            func_name = func_names[func] = utils.sanitize(utils.get_func_name(func))
         if indexed:
             func_name = '{}_{}'.format(idx, func_name)
         t = Task(name=func_name, func=func)
@@ -999,10 +1507,15 @@ def create_serialized_manager(name, *tasks, **kwargs):
     """tasks have no requirements and run one at a time in order given"""
     kwargs.setdefault('auto_reqs_from_previous_task', True)
     tm = TaskManager(name=name, **kwargs)
+    previous_task = None
     for task in tasks:
         if task.reqs:
             raise TaskException('task has requirements', task)
+        if previous_task is not None and tm.auto_reqs_from_previous_task:
+            # chain directly to the task we just added (add_task then has no requirements to derive)
+            task.reqs = {previous_task.name}
         tm.add_task(task)
+        previous_task = task
     return tm
 
 
@@ -1,8 +1,9 @@
 #! /usr/bin/env python
 
 # Standard Imports
-from Queue import Queue
-from threading import Thread
+from collections import deque
+from threading import Thread, Semaphore, Event, Lock
+import itertools
 import time
 
 # irtools Imports
@@ -13,9 +14,71 @@ log = logging.getLogger('irtools.kits.thread_pool')
 
 # Ideas was originally taken from https://www.metachris.com/2016/04/python-threadpool/ and modified heavily
 
+# the level each logger method logs at, to skip formatting notifications the logger would drop anyway
+_log_func_levels = {
+    logging.Logger.trace.__func__: logging.TRACE,
+    logging.Logger.debug.__func__: logging.DEBUG,
+    logging.Logger.info.__func__: logging.INFO,
+    logging.Logger.warning.__func__: logging.WARNING,
+    logging.Logger.warn.__func__: logging.WARNING,
+    logging.Logger.error.__func__: logging.ERROR,
+    logging.Logger.exception.__func__: logging.ERROR,
+    logging.Logger.critical.__func__: logging.CRITICAL,
+}
+
+
+def _exit_worker():
+    """ends the worker thread running it (the stop task, for worker classes that do not check for it)"""
+    raise SystemExit
+
+
+# queued once per worker by ThreadPool.stop, a worker that takes it exits
+_stop_worker = (_exit_worker, (), {})
+
+
+class _WorkerQueue(object):
+    """
+    the task_queue a worker is created with, the Queue methods workers have always used (get / task_done)
+    on top of the pool's per worker queues, so custom worker classes keep working unchanged
+    """
+
+    def __init__(self, parent_pool, own_queue):
+        self.parent_pool = parent_pool
+        self.own_queue = own_queue
+        self._stop_taken = False
+
+    def get(self):
+        """takes the next task for this worker, blocks until there is one"""
+        task = self.parent_pool._next_task(self.own_queue)
+        if task is _stop_worker:
+            self._stop_taken = True
+        return task
+
+    def task_done(self):
+        """marks the task taken by get as done (the stop task is not counted)"""
+        if not self._stop_taken:
+            self.parent_pool._task_done()
+
+    def put(self, task):
+        """adds a (func, args, kwargs) task to the pool"""
+        func, args, kwargs = task
+        self.parent_pool.add_task(func, *args, **kwargs)
+
+    def qsize(self):
+        """the number of tasks queued in the pool (not yet taken by a worker)"""
+        return sum(len(task_queue) for task_queue in self.parent_pool._queues)
+
+    def join(self):
+        """waits for all the tasks of the pool to complete"""
+        self.parent_pool.wait_completion()
+
 
 class Worker(Thread):
-    """ Thread executing tasks from a given tasks queue """
+    """ Thread executing tasks from its own tasks queue, stealing from the other workers when it is empty """
+
+    # kept on the class so it is still reachable while the interpreter tears down module globals
+    _stop_sentinel = _stop_worker
+
     def __init__(self, worker_id, task_queue, parent_pool):
         super(Worker, self).__init__()
         self.worker_id = worker_id
@@ -36,8 +99,12 @@ class Worker(Thread):
         overrides regular thread behaviour
         tells this worker to continuously read from a queue of tasks
         """
-        while self.operating:
-            func, args, kwargs = self.task_queue.get()
+        get_task, task_done = self.task_queue.get, self.task_queue.task_done
+        while True:
+            task = get_task()
+            if task is self._stop_sentinel:
+                return
+            func, args, kwargs = task
             if self.parent_pool.trace_logs:
                 self.notify(log.trace, 'worker starting task', func=func)
             try:
@@ -49,24 +116,43 @@ class Worker(Thread):
                 self.parent_pool.task_ok(self.worker_id, func, args, kwargs)
             finally:
                 # Mark this task as done, whether an exception happened or not
-                self.task_queue.task_done()
+                task_done()
 
 
 class ThreadPool(object):
     """ Pool of threads consuming tasks from a queue """
     def __init__(self, num_threads, worker_class=None, max_queue_size=0, **kwargs):
-        # task queue
-        self.tasks = Queue(max_queue_size)
+        # task queues, one per worker filled round-robin (idle workers steal from the others)
+        # deque append / pop / popleft are atomic so the only synchronization is the semaphores
+        self._queues = []
+        self._queue_counter = itertools.count()
+        self._tasks_available = Semaphore(0)  # released once per queued task, acquired by the worker taking it
+        self._queue_slots = Semaphore(max_queue_size) if max_queue_size > 0 else None  # blocks add_task when full
+        # completion tracking (for wait_completion)
+        self._unfinished_lock = Lock()
+        self._unfinished_count = 0
+        self._completed_count = 0  # also the version of the cached ok/nok counts
+        self._ok_nok_counts = (0, 0, 0)  # (version, ok, nok)
+        self._all_tasks_done = Event()
+        self._all_tasks_done.set()
         # flags
         self._operating = True
         # params
         self.trace_logs = kwargs.pop('trace_logs', False)
         self.name = kwargs.pop('name', id(self))
+        # built once, used by every log line
+        self._identification = '{}({})'.format(self.__class__.__name__, self.name)
+        self._worker_log_prefixes = {}
         # counters
         self._total_task_count = 0
-        self._tasks_ok_count = 0
-        self._tasks_nok_count = 0
+        # per worker, so each worker only ever writes its own entries (totals are summed when read)
         self.worker_counters = {}
+        self._worker_ok_counters = {}
+        self._worker_nok_counters = {}
+        # ids of the workers that completed at least one task (set.add is atomic, so no lock)
+        self._started_worker_ids = set()
+        # the pool as a Queue (put / join / qsize), as it used to be
+        self.tasks = _WorkerQueue(self, deque())
         # workers
         self._workers = {}
         self._worker_class = worker_class or Worker
@@ -78,19 +164,29 @@ class ThreadPool(object):
         if worker_id in self._workers:
             if raise_on_id_clash:
                 raise Exception('worker with that id already exists', worker_id)
-        worker = self._worker_class(worker_id=worker_id, task_queue=self.tasks, parent_pool=self)
-        self._workers[worker_id] = worker
+        task_queue = deque()
+        self._queues.append(task_queue)
+        # the Queue API (get / task_done) the workers consume, see _WorkerQueue
+        worker_queue = _WorkerQueue(self, task_queue)
+        # the prefix and counters must exist before the worker starts, it may log and count right away
+        self._worker_log_prefixes[worker_id] = '{} {}({})'.format(
+            self._identification, self._worker_class.__name__, worker_id)
         self.worker_counters[worker_id] = 0
+        self._worker_ok_counters[worker_id] = 0
+        self._worker_nok_counters[worker_id] = 0
+        worker = self._worker_class(worker_id=worker_id, task_queue=worker_queue, parent_pool=self)
+        self._workers[worker_id] = worker
 
     @property
     def identification(self):
-        return '{}({})'.format(self.__class__.__name__, self.name)
+        return self._identification
 
     def worker_notification(self, worker_id, log_func, message, **kwargs):
-        msg = '{} {}({}) {}: {}'.format(
-            self.identification,
-            self._worker_class.__name__,
-            worker_id,
+        level = _log_func_levels.get(getattr(log_func, '__func__', None))
+        if level is not None and not log_func.__self__.isEnabledFor(level):
+            return  # the message would be dropped, so don't sort and join the kwargs
+        msg = '{} {}: {}'.format(
+            self._worker_log_prefixes[worker_id],
             message,
             ' '.join(sorted(utils.convert_dict_params_to_list_of_string(kwargs)))
         )
@@ -103,7 +199,7 @@ class ThreadPool(object):
     @property
     def count_completed(self):
         """gets the current count of all completed tasks"""
-        return sum(self.worker_counters.values())
+        return self._completed_count
 
     @property
     def count_remaining(self):
@@ -118,60 +214,176 @@ class ThreadPool(object):
     @property
     def count_ok(self):
         """gets the total count of all tasks completed okay"""
-        return self._tasks_ok_count
+        return self._get_ok_nok_counts()[0]
 
     @property
     def count_nok(self):
         """gets the total count of all tasks completed not okay"""
-        return self._tasks_nok_count
+        return self._get_ok_nok_counts()[1]
+
+    def _get_ok_nok_counts(self):
+        """sums the per worker ok/nok counters, only again once more tasks were completed"""
+        version, ok, nok = self._ok_nok_counts
+        if version != self._completed_count:
+            version = self._completed_count
+            ok = sum(self._worker_ok_counters.values())
+            nok = sum(self._worker_nok_counters.values())
+            self._ok_nok_counts = (version, ok, nok)
+        return ok, nok
 
     @property
     def all_workers_started(self):
         """gets if all workers have started working"""
-        return all(self.worker_counters.values())
+        return len(self._started_worker_ids) == len(self.worker_counters)
 
     @property
     def any_workers_started(self):
         """gets if any workers have started working"""
-        return any(self.worker_counters.values())
+        return bool(self._started_worker_ids)
 
     def _increment_worker_count(self, worker_id):
         """count the number of tasks each worker completes"""
+        if not self.worker_counters[worker_id]:
+            self._started_worker_ids.add(worker_id)
         self.worker_counters[worker_id] += 1
 
     def task_ok(self, worker_id, func, args, kwargs):
         """count the number of tasks completed okay"""
         self._increment_worker_count(worker_id)
-        self._tasks_ok_count += 1
+        self._worker_ok_counters[worker_id] += 1
 
     def task_nok(self, worker_id, func, args, kwargs):
         """count the number of tasks completed not okay"""
         self._increment_worker_count(worker_id)
-        self._tasks_nok_count += 1
+        self._worker_nok_counters[worker_id] += 1
 
     def add_task(self, func, *args, **kwargs):
         """ Add a task to the queue """
-        self.tasks.put((func, args, kwargs))
+        if self._queue_slots is not None:
+            self._queue_slots.acquire()
+        with self._unfinished_lock:
+            self._unfinished_count += 1
+            self._all_tasks_done.clear()
         self._total_task_count += 1
+        self._enqueue((func, args, kwargs))
+
+    def add_tasks(self, tasks):
+        """
+        Add many tasks to the queue at once, each a (func, args, kwargs) tuple
+        the unfinished count is updated once for the whole batch
+        """
+        tasks = list(tasks)
+        if self._queue_slots is not None:
+            # a bounded queue must block for a free slot before each task
+            for func, args, kwargs in tasks:
+                self.add_task(func, *args, **kwargs)
+            return
+        if not tasks:
+            return
+        with self._unfinished_lock:
+            self._unfinished_count += len(tasks)
+            self._all_tasks_done.clear()
+        self._total_task_count += len(tasks)
+        queues = self._queues
+        queue_counter = self._queue_counter
+        for task in tasks:
+            queues[next(queue_counter) % len(queues)].append(task)
+        for _ in xrange(len(tasks)):
+            self._tasks_available.release()
+
+    def _enqueue(self, task):
+        """puts a task on the next worker queue (round-robin) and wakes a worker"""
+        self._queues[next(self._queue_counter) % len(self._queues)].append(task)
+        self._tasks_available.release()
+
+    def _next_task(self, own_queue):
+        """
+        takes the next task, blocks until there is one (called by the workers)
+        a worker takes the oldest task of its own queue, or else steals the newest task of another queue
+        """
+        self._tasks_available.acquire()
+        # every acquire matches one queued task, so a task is certain to be found (possibly after a retry)
+        task = None
+        while task is None:
+            try:
+                task = own_queue.popleft()
+            except IndexError:
+                task = self._steal_task()
+        if self._queue_slots is not None:
+            self._queue_slots.release()
+        return task
+
+    def _steal_task(self):
+        """takes the newest task from the first worker queue that has one, None if all are empty"""
+        for task_queue in self._queues:
+            try:
+                return task_queue.pop()
+            except IndexError:
+                continue
+        return None
+
+    def _task_done(self):
+        """marks a task taken from the queue as done (called by the workers)"""
+        with self._unfinished_lock:
+            self._completed_count += 1
+            self._unfinished_count -= 1
+            if not self._unfinished_count:
+                self._all_tasks_done.set()
 
     def map(self, func, args_list):
         """ Add a list of tasks to the queue """
         # Add the jobs in bulk to the thread pool. Alternatively you could use
-        # `add_task` to add single jobs. The code will block here, which
-        # makes it possible to cancel the thread pool with an exception when
+        # `add_task` to add single jobs. With a bounded queue the code will block here,
+        # which makes it possible to cancel the thread pool with an exception when
         # the currently running batch of workers is finished.
-        for args in args_list:
-            self.add_task(func, args)
+        self.add_tasks((func, (args,), {}) for args in args_list)
 
     def stop(self):
-        """stops the operation of this thread pool"""
+        """
+        stops the operation of this thread pool
+        every worker exits once it takes the stop sentinel queued for it, idle workers exit right away
+        """
+        if not self._operating:
+            return
         self._operating = False
+        for _ in xrange(len(self._workers)):
+            if self._queue_slots is not None:
+                self._queue_slots.acquire()
+            self._enqueue(_stop_worker)
+
+    def join(self):
+        """waits for all the workers to exit (after stop)"""
+        for worker in self._workers.values():
+            worker.join()
+
+    def shutdown(self):
+        """stops the thread pool and waits for the workers to exit (the queued tasks are completed first)"""
+        self.stop()
+        self.join()
+
+    def reset_counters(self):
+        """zeros all the task counters, so an idle pool can be reused (the workers stay alive)"""
+        with self._unfinished_lock:
+            if self._unfinished_count:
+                raise Exception('can not reset counters while tasks are unfinished', self._unfinished_count)
+            self._total_task_count = 0
+            self._completed_count = 0
+            self._ok_nok_counts = (0, 0, 0)
+            for counters in (self.worker_counters, self._worker_ok_counters, self._worker_nok_counters):
+                for worker_id in counters:
+                    counters[worker_id] = 0
+            self._started_worker_ids.clear()
 
     @property
     def finished(self):
         """are all tasks complete (based on count)"""
         return bool(self.count_remaining == 0)
 
+    @property
+    def finished_event(self):
+        """an Event that is set while all the added tasks are complete (cleared again when a task is added)"""
+        return self._all_tasks_done
+
     @property
     def processing(self):
         """are tasks still being processed"""
@@ -179,7 +391,9 @@ class ThreadPool(object):
 
     def wait_completion(self):
         """ Wait for completion of all the tasks in the queue BLOCKING """
-        self.tasks.join()
+        # re-test after every wake up: a task added right after the last one completed clears the event again
+        while not self._all_tasks_done.wait():
+            pass
 
     def notify_progress(self):
         """sends the current progress status to the log"""
@@ -187,12 +401,27 @@ class ThreadPool(object):
             self.identification, self.count_completed, self.count_total, self.count_ok, self.count_nok))
 
     def wait_with_progress(self, period=30, timeout=None):
+        """
+        wait for completion of all the tasks, logging the progress every period
+        returns as soon as the last task completes (not at the end of the period)
+        :param period: seconds between progress logs
+        :param timeout: stop waiting after this many seconds (the tasks keep running)
+        :return: True if all the tasks completed, False on timeout
+        """
         log.info('{} waiting with progress: threads={} tasks={}'.format(
             self.identification, len(self._workers), self.count_total))
 
+        end_time = time.time() + timeout if timeout is not None else None
         while self.processing:
             self.notify_progress()
-            time.sleep(period)
+            wait_time = period
+            if end_time is not None:
+                wait_time = min(wait_time, end_time - time.time())
+                if wait_time <= 0:
+                    log.info('{} waiting timed out: timeout={}'.format(self.identification, timeout))
+                    return False
+            self._all_tasks_done.wait(wait_time)
 
         log.info('{} finished: ran={}/{} ok={} nok={}'.format(
             self.identification, self.count_completed, self.count_total, self.count_ok, self.count_nok))
+        return True
@@ -1,10 +1,14 @@
 # Standard Imports
+import atexit
 import ctypes
+from ctypes import wintypes
 import string
+import struct
 import time
 
 # irtools Imports
 from irtools import *
+from thread_pool import ThreadPool
 
 # External Imports
 
@@ -13,6 +17,80 @@ log = logging.getLogger('irtools.kits.virtual_interface')
 # convenience
 user32 = ctypes.windll.user32
 
+# the user32 functions used for every key and button, bound once with explicit signatures
+# so a call does not look the function up or infer the argument types again
+_mouse_event = user32.mouse_event
+_mouse_event.argtypes = (wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, ctypes.c_size_t)  # ULONG_PTR
+_mouse_event.restype = None
+_set_cursor_pos = user32.SetCursorPos
+_set_cursor_pos.argtypes = (ctypes.c_int, ctypes.c_int)
+_set_cursor_pos.restype = wintypes.BOOL
+
+# SendInput, sends many input events in a single call
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+INPUT_HARDWARE = 2
+KEYEVENTF_KEYUP = 0x0002
+
+
+class KEYBDINPUT(ctypes.Structure):
+    _fields_ = (
+        ('wVk', wintypes.WORD),
+        ('wScan', wintypes.WORD),
+        ('dwFlags', wintypes.DWORD),
+        ('time', wintypes.DWORD),
+        ('dwExtraInfo', ctypes.c_size_t),  # ULONG_PTR
+    )
+
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = (
+        ('dx', wintypes.LONG),
+        ('dy', wintypes.LONG),
+        ('mouseData', wintypes.DWORD),
+        ('dwFlags', wintypes.DWORD),
+        ('time', wintypes.DWORD),
+        ('dwExtraInfo', ctypes.c_size_t),  # ULONG_PTR
+    )
+
+
+class HARDWAREINPUT(ctypes.Structure):
+    _fields_ = (
+        ('uMsg', wintypes.DWORD),
+        ('wParamL', wintypes.WORD),
+        ('wParamH', wintypes.WORD),
+    )
+
+
+class _INPUT_UNION(ctypes.Union):
+    _fields_ = (
+        ('ki', KEYBDINPUT),
+        ('mi', MOUSEINPUT),
+        ('hi', HARDWAREINPUT),
+    )
+
+
+class INPUT(ctypes.Structure):
+    _anonymous_ = ('u',)
+    _fields_ = (
+        ('type', wintypes.DWORD),
+        ('u', _INPUT_UNION),
+    )
+
+
+_send_input = user32.SendInput
+_send_input.argtypes = (wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int)
+_send_input.restype = wintypes.UINT
+
+# batches of keyboard INPUTs are built in a flat buffer (instead of a ctypes object per event):
+# the bytes of an empty keyboard INPUT, and where its key and flags are packed
+_input_size = ctypes.sizeof(INPUT)
+_keyboard_input_bytes = bytes(bytearray(INPUT(type=INPUT_KEYBOARD)))
+_pack_key_into = struct.Struct('H').pack_into  # wVk (native byte order, like ctypes)
+_pack_key_flags_into = struct.Struct('I').pack_into  # dwFlags
+_key_offset = INPUT.u.offset + KEYBDINPUT.wVk.offset
+_key_flags_offset = INPUT.u.offset + KEYBDINPUT.dwFlags.offset
+
 
 # Thanks to GameMaster's post here https://stackoverflow.com/a/54729193/1561176
 # for inspiring me to write a proper VirtualInterface kit.
@@ -21,6 +99,10 @@ class VirtualInterfaceError(Exception):
     pass
 
 
+class SendInputError(VirtualInterfaceError):
+    pass
+
+
 class UnknownKeyOrButtonError(VirtualInterfaceError):
     pass
 
@@ -48,7 +130,7 @@ class KeyboardKey(object):
     pgdown = 0x22
     end = 0x23
     home = 0x24
-    leftarrow = 0x26
+    leftarrow = 0x25
     uparrow = 0x26
     rightarrow = 0x27
     downarrow = 0x28
@@ -101,6 +183,7 @@ class KeyboardKey(object):
     sleep = 0x5F
     numpad0 = 0x60
     numpad1 = 0x61
+    numpad2 = 0x62
     numpad3 = 0x63
     numpad4 = 0x64
     numpad5 = 0x65
@@ -131,6 +214,7 @@ class KeyboardKey(object):
     F15 = 0x7E
     F16 = 0x7F
     F17 = 0x80
+    F18 = 0x81
     F19 = 0x82
     F20 = 0x83
     F21 = 0x84
@@ -179,6 +263,12 @@ class KeyboardKey(object):
     clear = 0xFE
 
 
+# the key codes by key name, for get_key
+_keyboard_keys_by_name = {name: code for name, code in vars(KeyboardKey).items() if not name.startswith('_')}
+# every key must have its own code (a copy-paste code presses the wrong key silently)
+assert len(set(_keyboard_keys_by_name.values())) == len(_keyboard_keys_by_name), 'duplicate KeyboardKey codes'
+
+
 class MouseButton(object):
     left = 0
     right = 1
@@ -189,30 +279,87 @@ class VirtualInterface(object):
     # press/release time delay_press
     delay_hold = 0.01
     delay_release = 0.01
+    # delays shorter than this are waited out against the high resolution clock instead of sleeping,
+    # since a sleep can not be shorter than the timer resolution (~15ms by default, see set_timer_resolution)
+    spin_delays_below = 0.002
+    # the timer resolution set by set_timer_resolution (milliseconds)
+    _timer_resolution = None
 
+    # the delays are passed down with the rest of the kwargs, so each one ignores the other
     @classmethod
-    def _delay_hold(cls, delay_hold=None):
-        delay = delay_hold or cls.delay_hold
-        time.sleep(delay)
+    def _delay_hold(cls, delay_hold=None, **kwargs):
+        cls._delay(cls.delay_hold if delay_hold is None else delay_hold)
 
     @classmethod
-    def _delay_release(cls, delay_release=None):
-        delay = delay_release or cls.delay_release
+    def _delay_release(cls, delay_release=None, **kwargs):
+        cls._delay(cls.delay_release if delay_release is None else delay_release)
+
+    @classmethod
+    def _delay(cls, delay):
+        if delay <= 0:
+            return
+        if delay < cls.spin_delays_below:
+            # time.clock is the high resolution performance counter on windows
+            deadline = time.clock() + delay
+            while time.clock() < deadline:
+                pass
+            return
         time.sleep(delay)
 
+    @staticmethod
+    def set_timer_resolution(milliseconds=1):
+        """
+        sets the system timer resolution (timeBeginPeriod) so sleeps keep ms-level timing, reset at exit
+        this affects the whole system (and power usage), so it is only done on request
+        """
+        winmm = ctypes.windll.winmm
+        if VirtualInterface._timer_resolution is not None:
+            winmm.timeEndPeriod(VirtualInterface._timer_resolution)
+        else:
+            atexit.register(VirtualInterface.reset_timer_resolution)
+        winmm.timeBeginPeriod(milliseconds)
+        VirtualInterface._timer_resolution = milliseconds
+
+    @staticmethod
+    def reset_timer_resolution():
+        """resets the system timer resolution set by set_timer_resolution"""
+        if VirtualInterface._timer_resolution is not None:
+            ctypes.windll.winmm.timeEndPeriod(VirtualInterface._timer_resolution)
+            VirtualInterface._timer_resolution = None
+
 
 class VirtualKeyboard(VirtualInterface):
 
+    @staticmethod
+    def send_key_events(key_events):
+        """
+        sends keyboard events with a single SendInput call
+        :param key_events: sequence of (key, flags), flags are 0 to press the key or KEYEVENTF_KEYUP to release it
+        """
+        count = len(key_events)
+        buf = bytearray(_keyboard_input_bytes * count)
+        offset = 0
+        for key, flags in key_events:
+            _pack_key_into(buf, offset + _key_offset, key)
+            if flags:
+                _pack_key_flags_into(buf, offset + _key_flags_offset, flags)
+            offset += _input_size
+        inputs = (INPUT * count).from_buffer(buf)
+        sent = _send_input(count, inputs, _input_size)
+        if sent != count:
+            # the input was blocked (by another thread or a higher integrity process)
+            raise SendInputError(sent, count)
+
     @classmethod
     def hold_key(cls, key, **kwargs):
         """Presses key"""
-        user32.keybd_event(key, 0, 0, 0)
+        cls.send_key_events(((key, 0),))
         cls._delay_hold(**kwargs)
 
     @classmethod
     def release_key(cls, key, **kwargs):
         """Releases key"""
-        user32.keybd_event(key, 0, 2, 0)
+        cls.send_key_events(((key, KEYEVENTF_KEYUP),))
         cls._delay_release(**kwargs)
 
     @classmethod
@@ -231,16 +378,65 @@ class VirtualKeyboard(VirtualInterface):
     @classmethod
     def type_character(cls, character, **kwargs):
         """type the character using the virtual keyboard"""
-        use_shift = KeyboardCharacters.character_requires_shift(character)
-        key_to_press = KeyboardCharacters.character_to_key_name(character)
+        key_to_press, use_shift = KeyboardCharacters.character_to_key_and_shift(character)
         if use_shift:
             cls.shift_press_key(key_to_press, **kwargs)
         else:
             cls.press_key(key_to_press, **kwargs)
 
     @classmethod
-    def type_sequence(cls, sequence, **kwargs):
-        """type out a sequence of characters using the virtual keyboard"""
+    def character_key_events(cls, character):
+        """the keyboard events (see send_key_events) that type the character"""
+        key, use_shift = KeyboardCharacters.character_to_key_and_shift(character)
+        if use_shift:
+            return (KeyboardKey.shift, 0), (key, 0), (key, KEYEVENTF_KEYUP), (KeyboardKey.shift, KEYEVENTF_KEYUP)
+        return (key, 0), (key, KEYEVENTF_KEYUP)
+
+    @classmethod
+    def sequence_key_events(cls, sequence):
+        """the keyboard events (see send_key_events) that type the sequence"""
+        return [event for character in sequence for event in cls.character_key_events(character)]
+
+    @classmethod
+    def _send_sequence_pipelined(cls, sequence, chunk_size):
+        """
+        sends the events of a long sequence chunk by chunk, a single worker sends the chunks (in order)
+        while the next chunks are being built
+        """
+        pool = ThreadPool(1, name='type_sequence')
+        try:
+            for start in xrange(0, len(sequence), chunk_size):
+                pool.add_task(cls.send_key_events, cls.sequence_key_events(sequence[start:start + chunk_size]))
+            pool.wait_completion()
+        finally:
+            pool.stop()
+            pool.join()
+        if pool.count_nok:
+            raise SendInputError('chunks failed to send', pool.count_nok)
+
+    @classmethod
+    def type_sequence(cls, sequence, batch=False, delays=True, chunk_size=None, **kwargs):
+        """
+        type out a sequence of characters using the virtual keyboard
+        scripted typing with no one watching (or latency sensitive callers) should use delays=False or batch=True
+        :param sequence:
+        :param batch: send the events of the whole sequence with a single SendInput call (without any delays)
+        :param delays: when False, the keys are pressed and released without any delays
+        :param chunk_size: when batching a longer sequence, send it in chunks of this many characters,
+            each chunk is sent while the next one is being built
+        :param kwargs: the delays to use when not batching
+        :return:
+        """
+        if not delays:
+            kwargs.update(delay_hold=0, delay_release=0)
+        if batch:
+            if chunk_size and len(sequence) > chunk_size:
+                cls._send_sequence_pipelined(sequence, chunk_size)
+                return
+            key_events = cls.sequence_key_events(sequence)
+            if key_events:
+                cls.send_key_events(key_events)
+            return
         for character in sequence:
             cls.type_character(character, **kwargs)
 
@@ -249,7 +445,7 @@ class VirtualMouse(VirtualInterface):
 
     @classmethod
     def set_mouse_to_position(cls, x, y):
-        user32.SetCursorPos(x, y)
+        _set_cursor_pos(x, y)
 
     @classmethod
     def click_left_button(cls, **kwargs):
@@ -268,72 +464,77 @@ class VirtualMouse(VirtualInterface):
 
     @classmethod
     def hold_left_button(cls, **kwargs):
-        user32.mouse_event(0x0002, 0, 0, 0, 0)
+        _mouse_event(0x0002, 0, 0, 0, 0)
         cls._delay_hold(**kwargs)
 
     @classmethod
     def hold_right_button(cls, **kwargs):
-        user32.mouse_event(0x0008, 0, 0, 0, 0)
+        _mouse_event(0x0008, 0, 0, 0, 0)
         cls._delay_hold(**kwargs)
 
     @classmethod
     def hold_middle_button(cls, **kwargs):
-        user32.mouse_event(0x00020, 0, 0, 0, 0)
+        _mouse_event(0x00020, 0, 0, 0, 0)
         cls._delay_hold(**kwargs)
 
     @classmethod
     def release_left_button(cls, **kwargs):
-        user32.mouse_event(0x0004, 0, 0, 0, 0)
+        _mouse_event(0x0004, 0, 0, 0, 0)
         cls._delay_release(**kwargs)
 
     @classmethod
     def release_right_button(cls, **kwargs):
-        user32.mouse_event(0x00010, 0, 0, 0, 0)
+        _mouse_event(0x00010, 0, 0, 0, 0)
         cls._delay_release(**kwargs)
 
     @classmethod
     def release_middle_button(cls, **kwargs):
-        user32.mouse_event(0x00040, 0, 0, 0, 0)
+        _mouse_event(0x00040, 0, 0, 0, 0)
         cls._delay_release(**kwargs)
 
+    # the methods for each button, by name so subclasses can override them
+    _click_methods = {
+        MouseButton.left: 'click_left_button',
+        MouseButton.right: 'click_right_button',
+        MouseButton.middle: 'click_middle_button',
+    }
+    _hold_methods = {
+        MouseButton.left: 'hold_left_button',
+        MouseButton.right: 'hold_right_button',
+        MouseButton.middle: 'hold_middle_button',
+    }
+    _release_methods = {
+        MouseButton.left: 'release_left_button',
+        MouseButton.right: 'release_right_button',
+        MouseButton.middle: 'release_middle_button',
+    }
+
     @classmethod
-    def click_mouse_button(cls, button, **kwargs):
-        if button == MouseButton.left:
-            cls.click_left_button(**kwargs)
-        elif button == MouseButton.right:
-            cls.click_right_button(**kwargs)
-        elif button == MouseButton.middle:
-            cls.click_middle_button(**kwargs)
-        else:
+    def _get_button_method(cls, methods, button):
+        """gets the method for the button from one of the button method tables"""
+        try:
+            return getattr(cls, methods[button])
+        except (KeyError, TypeError):
             raise UnknownButtonError(button)
 
+    @classmethod
+    def click_mouse_button(cls, button, **kwargs):
+        cls._get_button_method(cls._click_methods, button)(**kwargs)
+
     @classmethod
     def hold_mouse_button(cls, button, **kwargs):
-        if button == 0:
-            cls.hold_left_button(**kwargs)
-        elif button == 1:
-            cls.hold_right_button(**kwargs)
-        elif button == 2:
-            cls.hold_middle_button(**kwargs)
-        else:
-            raise UnknownButtonError(button)
+        cls._get_button_method(cls._hold_methods, button)(**kwargs)
 
     @classmethod
     def release_mouse_button(cls, button, **kwargs):
-        if button == 0:
-            cls.release_left_button(**kwargs)
-        elif button == 1:
-            cls.release_right_button(**kwargs)
-        elif button == 2:
-            cls.release_middle_button(**kwargs)
-        else:
-            raise UnknownButtonError(button)
+        cls._get_button_method(cls._release_methods, button)(**kwargs)
 
 
 class KeyboardCharacters(object):
     lowercase_letters = string.ascii_lowercase
     uppercase_letters = string.ascii_uppercase
-    characters_that_are_letters = lowercase_letters + uppercase_letters
+    # the character classes are frozensets, for constant time membership checks
+    characters_that_are_letters = frozenset(lowercase_letters + uppercase_letters)
     shift_map_letter_characters = dict(zip(lowercase_letters, uppercase_letters))
     shift_map_numbers = {
         '1': '!',
@@ -347,7 +548,7 @@ class KeyboardCharacters(object):
         '9': '(',
         '0': ')',
     }
-    characters_that_are_numbers = shift_map_numbers.keys() + shift_map_numbers.values()
+    characters_that_are_numbers = frozenset(shift_map_numbers).union(shift_map_numbers.values())
     shift_map_punctuation_characters = {
         '`': '~',   # accent
         '-': '_',   # dash
@@ -361,12 +562,11 @@ class KeyboardCharacters(object):
         '.': '>',   # period
         '/': '?',   # forwardslash
     }
-    characters_that_are_punctuation = shift_map_punctuation_characters.keys() + \
-                                      shift_map_punctuation_characters.values()
-    characters_requiring_shift = shift_map_letter_characters.values() + \
-                                 shift_map_numbers.values() + \
-                                 shift_map_punctuation_characters.values()
-    characters_that_are_whitespace = string.whitespace
+    characters_that_are_punctuation = frozenset(shift_map_punctuation_characters).union(
+        shift_map_punctuation_characters.values())
+    characters_requiring_shift = frozenset(shift_map_letter_characters.values()).union(
+        shift_map_numbers.values(), shift_map_punctuation_characters.values())
+    characters_that_are_whitespace = frozenset(string.whitespace)
     # map to key names for special characters
     map_key_to_punctuation_characters = {
         KeyboardKey.accent: ['`', '~'],
@@ -403,31 +603,52 @@ class KeyboardCharacters(object):
         KeyboardKey.num0: ['0', ')'],
     }
 
+    # built lazily per class (see _get_character_lookup)
+    _character_lookup = None
+
+    @classmethod
+    def _get_character_lookup(cls):
+        """
+        gets the lookup of every typeable character to its (key, requires_shift), built once per class
+        (inverts the letters and the number, punctuation and whitespace maps)
+        """
+        if cls.__dict__.get('_character_lookup') is None:
+            character_lookup = {}
+            for lowercase_letter, uppercase_letter in cls.shift_map_letter_characters.items():
+                key = cls.get_key(lowercase_letter)
+                character_lookup[lowercase_letter] = (key, False)
+                character_lookup[uppercase_letter] = (key, uppercase_letter in cls.characters_requiring_shift)
+            for key_map in (cls.map_key_to_number_characters, cls.map_key_to_punctuation_characters,
+                            cls.map_key_to_whitespace_characters):
+                for key, characters in key_map.items():
+                    for character in characters:
+                        character_lookup[character] = (key, character in cls.characters_requiring_shift)
+            cls._character_lookup = character_lookup
+        return cls._character_lookup
+
     @classmethod
     def character_to_key_name(cls, character):
         """get the key_name of the keyboard button that maps to this character"""
-        assert character in string.printable
-        if character in cls.characters_that_are_letters:
-            key_name = character.lower()
-            return cls.get_key(key_name)
-        elif character in cls.characters_that_are_numbers:
-            for key, numbers in cls.map_key_to_number_characters.items():
-                if character in numbers:
-                    return key
-        elif character in cls.characters_that_are_punctuation:
-            for key, punctuations in cls.map_key_to_punctuation_characters.items():
-                if character in punctuations:
-                    return key
-        elif character in cls.characters_that_are_whitespace:
-            for key, whitespace in cls.map_key_to_whitespace_characters.items():
-                if character in whitespace:
-                    return key
-        raise UnknownKeyError(character)
+        try:
+            return cls._get_character_lookup()[character][0]
+        except KeyError:
+            raise UnknownKeyError(character)
+
+    @classmethod
+    def character_to_key_and_shift(cls, character):
+        """get the key of the keyboard button that maps to this character, and if it requires shift"""
+        try:
+            return cls._get_character_lookup()[character]
+        except KeyError:
+            raise UnknownKeyError(character)
 
     @classmethod
     def character_requires_shift(cls, character):
-        return bool(character in cls.characters_requiring_shift)
+        return cls._get_character_lookup().get(character, (None, False))[1]
 
     @classmethod
     def get_key(cls, key_name):
-        return getattr(KeyboardKey, key_name)
+        try:
+            return _keyboard_keys_by_name[key_name]
+        except KeyError:
+            raise UnknownKeyError(key_name)
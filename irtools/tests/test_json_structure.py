@@ -168,3 +168,101 @@ class TestJsonStructure(unittest.TestCase):
         self.assertDictEqual(o.js.export_to_json_data(), {'a': 1, 'b': 'hello'})
         self.assertTrue(isinstance(o.js, JSInner))
         self.assertTrue(all(isinstance(js, JSInner) for js in o.js_list))
+
+    def test_equality(self):
+        js = JsonStructure(json_data={'a': 1, 'b': [1, {'c': JsonStructure(json_data={'x': [1, 2]})}]})
+        same = JsonStructure(json_data={'a': 1, 'b': [1, {'c': {'x': [1, 2]}}]})
+        different = JsonStructure(json_data={'a': 1, 'b': [1, {'c': {'x': [1, 3]}}]})
+        self.assertTrue(js == same)
+        self.assertTrue(same == js)
+        self.assertFalse(js == different)
+        self.assertFalse(JsonStructure(json_data={'a': []}) == JsonStructure(json_data={'a': {}}))
+
+    def test_cached_properties(self):
+        class JSCached(JsonStructure):
+            _js_properties = {
+                'inner_value': ['inner', 'value'],
+            }
+            _flag_cache_properties = True
+
+        js = JSCached(json_data={'inner': {'value': 1}})
+        self.assertEqual(1, js.inner_value)
+        self.assertEqual(1, js['inner_value'])
+        js['inner'] = {'value': 2}
+        self.assertEqual(2, js.inner_value)
+        js.load_data({'inner': {'value': 3}})
+        self.assertEqual(3, js.inner_value)
+
+    def test_cache_by_payload(self):
+        class JSInnerCached(JsonStructure):
+            _js_required_structure = {
+                'root': {
+                    'a': int,
+                }
+            }
+
+        class JSCachedPayload(JsonStructure):
+            _js_required_structure = {
+                'root': {
+                    'js': JSInnerCached,
+                }
+            }
+            _js_default_data = {
+                'root': {
+                    'b': 'hello',
+                }
+            }
+            _flag_cache_by_payload = True
+
+        first = JSCachedPayload(json_data={'js': {'a': 1}})
+        second = JSCachedPayload(json_data={'js': {'a': 1}})
+        self.assertEqual(1, len(JSCachedPayload._js_cached_payloads))
+        self.assertTrue(first == second)
+        self.assertTrue(isinstance(second.js, JSInnerCached))
+        self.assertFalse(first.js is second.js)
+        self.assertEqual('hello', second.b)
+        second['b'] = 'changed'
+        self.assertEqual('hello', JSCachedPayload(json_data={'js': {'a': 1}}).b)
+
+    def test_cache_by_payload_hit_matches_miss(self):
+        class JSInnerTagged(JsonStructure):
+            _js_default_data = {
+                'root': {
+                    'inner_default': 1,
+                }
+            }
+
+            def __init__(self, json_data=None):
+                self.tag = 'x'
+                super(JSInnerTagged, self).__init__(json_data=json_data)
+
+        class JSCachedTagged(JsonStructure):
+            _js_required_structure = {
+                'root': {
+                    'js': JSInnerTagged,
+                    'js_list': [JSInnerTagged],
+                }
+            }
+            _js_default_data = {
+                'root': {
+                    'b': 'hello',
+                    'js_default': JSInnerTagged,
+                }
+            }
+            _flag_cache_by_payload = True
+
+        miss_data = {'js': {'a': 1}, 'js_list': [{'c': 2}]}
+        hit_data = {'js': {'a': 1}, 'js_list': [{'c': 2}]}
+        miss = JSCachedTagged(json_data=miss_data)
+        hit = JSCachedTagged(json_data=hit_data)
+        self.assertEqual(1, len(JSCachedTagged._js_cached_payloads))
+        self.assertEqual(miss.export_to_json_data(), hit.export_to_json_data())
+        # the payload given is changed in place the same way on a hit as on a miss
+        self.assertEqual(sorted(miss_data), sorted(hit_data))
+        self.assertEqual('hello', hit_data['b'])
+        for data in (miss_data, hit_data):
+            for inner in (data['js'], data['js_default'], data['js_list'][0]):
+                self.assertTrue(isinstance(inner, JSInnerTagged))
+                self.assertEqual('x', inner.tag)
+                self.assertEqual(1, inner.inner_default)
+        self.assertTrue(hit.js is hit_data['js'])
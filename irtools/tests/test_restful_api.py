@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+
+# Standard Imports
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+# irtools Imports
+from irtools import *
+from irtools.kits import restful_api
+from irtools.kits.json_structure import JsonStructure
+
+# Logging
+log = logging.getLogger('irtools.tests.restful_api')
+utils.logging_setup(level=0, log_file=ir_log_dir + '/test_restful_api.log')
+
+
+class FakeRequest(object):
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+        self.body = None
+
+
+class FakeResponse(object):
+    def __init__(self, method, url, content=None):
+        self.request = FakeRequest(method, url)
+        self.status_code = 200
+        self.ok = True
+        self.content = url if content is None else content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeSession(object):
+    """stands in for a requests session, fails the urls ending with 'fail'"""
+
+    def __init__(self, content=None):
+        self.content = content
+        self.lock = threading.Lock()
+        self.requests = []
+        self.threads = set()
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.requests.append((method, url))
+            self.threads.add(threading.current_thread().name)
+        if url.endswith('fail'):
+            raise RuntimeError('request failed', url)
+        return FakeResponse(method, url, self.content)
+
+    def close(self):
+        pass
+
+
+class DefaultsStructure(JsonStructure):
+    _js_default_data = {'root': {'extra': 1}}
+
+
+class DefaultsRestObject(restful_api.JsonRestObject):
+    _json_structure_class = DefaultsStructure
+
+
+class TestRestfulAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.api = restful_api.RestfulAPI('http://localhost', name='test_restful_api')
+        self.session = self.api.session = FakeSession()
+
+    def _make_logged_api(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        api = restful_api.RestfulAPI('http://localhost', name='test_restful_api', log_rest_dir=log_dir)
+        api.session = FakeSession()
+        return api
+
+    def test_background_log_snapshot(self):
+        api = self._make_logged_api()
+        response = api.request_get('http://localhost/snapshot', _log_transact_id='snapshot')
+        # the caller changes the response before the background writer gets to it
+        response.content = 'changed'
+        api.flush_transaction_logs()
+        self.assertEquals('http://localhost/snapshot',
+                          utils.read_file(os.path.join(api.response_data_dir, 'snapshot.txt'), as_str=True))
+
+    def test_streamed_response_logged_in_caller(self):
+        api = self._make_logged_api()
+        api.request_get('http://localhost/streamed', stream=True, _log_transact_id='streamed')
+        # written before returning, not queued to the background writer
+        self.assertTrue(os.path.exists(os.path.join(api.response_data_dir, 'streamed.txt')))
+
+    def test_request_many(self):
+        urls = ['http://localhost/{}'.format(i) for i in range(20)] + ['http://localhost/fail']
+        results = self.api.request_many('get', urls, max_workers=4, _log_save_request=False,
+                                        _log_save_response=False)
+
+        self.assertEquals(len(urls), len(results))
+        self.assertEquals(urls[:-1], [r.content for r in results[:-1]])
+        self.assertTrue(all(r.request.method == 'GET' for r in results[:-1]))
+        self.assertIsInstance(results[-1], RuntimeError)
+        self.assertEquals(sorted(urls), sorted(url for _, url in self.session.requests))
+        self.assertLessEqual(len(self.session.threads), 4)
+
+    def test_request_many_no_urls(self):
+        self.assertEquals([], self.api.request_many('get', []))
+        self.assertEquals([], self.session.requests)
+
+    def test_update_keeps_response_content(self):
+        rest_object = DefaultsRestObject(base_url='http://localhost', name='test_restful_api')
+        rest_object.session = FakeSession(content='{"name": "x"}')
+        response = rest_object.get_and_update('http://localhost/object', return_response=True,
+                                              _log_save_request=False, _log_save_response=False)
+        self.assertEquals(1, rest_object.data.extra)
+        self.assertEquals({'name': 'x'}, rest_object._get_content_from_json(response))
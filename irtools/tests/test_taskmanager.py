@@ -1,8 +1,10 @@
 #! /usr/bin/env python
 
 # Standard Imports
+import gc
 import unittest
 from random import randrange
+import threading
 import time
 
 # irtools Imports
@@ -22,10 +24,25 @@ def _log(text):
 
 def _loop_log_wait(text, loop, wait):
     for i in range(loop):
-        log.trace('test-method|loop_log_wait: text={} loop={} wait={}'.format(text, i, wait))
+        log.trace('test-method|loop_log_wait: text=%s loop=%s wait=%s', text, i, wait)
         time.sleep(wait)
 
 
+_cached_calls = []
+
+
+def _cached_func(value):
+    _cached_calls.append(value)
+    return 0
+
+
+def _make_cached_manager(name, cache, *fargs_list):
+    tm = taskmanager.TaskManager(name, cache_backend=cache)
+    for idx, fargs in enumerate(fargs_list):
+        tm.add_task(taskmanager.Task(name='cached_{}'.format(idx), func=_cached_func, fargs=fargs))
+    return tm
+
+
 def _make_task_tree_alpha():
     """
     task tree alpha
@@ -148,6 +165,103 @@ class TestTaskManager(unittest.TestCase):
         for task_name in ninth_wave:
             tm.tasks[task_name].finished = True
 
+    def test_reduce_reqs(self):
+        tm = taskmanager.TaskManager('test_reduce_reqs', reduce_reqs=True)
+        tm.add_task(taskmanager.Task(name='a', func=utils.noop))
+        tm.add_task(taskmanager.Task(name='b', func=utils.noop, reqs='a'))
+        tm.add_task(taskmanager.Task(name='c', func=utils.noop, reqs={'a', 'b'}))
+        tm.add_task(taskmanager.Task(name='d', func=utils.noop, reqs={'a', 'c'}))
+        tm.add_task(taskmanager.Task(name='e', func=utils.noop, reqs={'b', 'c'}))
+        tm._prepare()
+        self.assertEquals({'b'}, tm.tasks['c'].reqs)
+        self.assertEquals({'c'}, tm.tasks['d'].reqs)
+        self.assertEquals({'c'}, tm.tasks['e'].reqs)
+        self.assertEquals({'b'}, tm.tasks['a'].next_tasks)
+        self.assertEquals({'c'}, tm.tasks['b'].next_tasks)
+        self.assertEquals(['a'], tm._get_ready_tasks())
+
+    def test_task_extra_attributes(self):
+        task = taskmanager.Task(name='extra', func=utils.noop)
+        task.extra = 1
+        self.assertEquals(1, task.extra)
+
+    def test_non_daemon_task(self):
+        tm = taskmanager.TaskManager('test_non_daemon_task')
+        tm.add_task(taskmanager.Task(name='daemon', func=utils.noop))
+        tm.add_task(taskmanager.Task(name='non_daemon', func=utils.noop, run_as_daemon=False))
+        tm.go()
+        self.assertTrue(tm.tasks['daemon'].thread.daemon)
+        self.assertFalse(tm.tasks['non_daemon'].thread.daemon)
+
+    def test_result_cache_hit(self):
+        cache = {}
+        del _cached_calls[:]
+        _make_cached_manager('test_result_cache_hit_1', cache, [1]).go()
+        self.assertEquals([1], _cached_calls)
+        self.assertEquals(1, len(cache))
+        tm = _make_cached_manager('test_result_cache_hit_2', cache, [1])
+        tm.go()
+        self.assertEquals([1], _cached_calls)
+        self.assertEquals(0, tm.worst_rc)
+
+    def test_result_cache_miss(self):
+        cache = {}
+        del _cached_calls[:]
+        _make_cached_manager('test_result_cache_miss_1', cache, [1]).go()
+        _make_cached_manager('test_result_cache_miss_2', cache, [2]).go()
+        self.assertEquals([1, 2], _cached_calls)
+        self.assertEquals(2, len(cache))
+
+    def test_result_cache_func_identity(self):
+        # a different func with the same name must not share the cached ret
+        def _cached_func(value):
+            _cached_calls.append(-value)
+            return 0
+
+        cache = {}
+        del _cached_calls[:]
+        _make_cached_manager('test_result_cache_func_identity_1', cache, [1]).go()
+        tm = taskmanager.TaskManager('test_result_cache_func_identity_2', cache_backend=cache)
+        tm.add_task(taskmanager.Task(name='cached_0', func=_cached_func, fargs=[1]))
+        tm.go()
+        self.assertEquals([1, -1], _cached_calls)
+
+    def test_result_cache_unpicklable_args(self):
+        cache = {}
+        del _cached_calls[:]
+        lock = threading.Lock()
+        _make_cached_manager('test_result_cache_unpicklable_args_1', cache, [lock]).go()
+        tm = _make_cached_manager('test_result_cache_unpicklable_args_2', cache, [lock])
+        tm.go()
+        self.assertEquals([lock, lock], _cached_calls)
+        self.assertEquals({}, cache)
+        self.assertIsNone(tm.tasks['cached_0'].result_digest)
+
+    def test_task_outlives_manager(self):
+        tm = taskmanager.TaskManager('test_task_outlives_manager')
+        task = taskmanager.Task(name='orphan', func=utils.noop)
+        tm.add_task(task)
+        del tm
+        gc.collect()
+        self.assertIsNone(task.task_manager)
+        task.go_wait()
+        self.assertTrue(task.finished)
+        self.assertEquals(0, task.rc)
+
+    def test_result_cache_requirement_cycle(self):
+        tm = taskmanager.TaskManager('test_result_cache_requirement_cycle', cache_backend={})
+        tm.add_task(taskmanager.Task(name='a', func=utils.noop, reqs='c'))
+        tm.add_task(taskmanager.Task(name='b', func=utils.noop, reqs='a'))
+        tm.add_task(taskmanager.Task(name='c', func=utils.noop, reqs='b'))
+        tm.add_task(taskmanager.Task(name='d', func=utils.noop, reqs='c'))
+        tm.add_task(taskmanager.Task(name='e', func=utils.noop))
+        tm.add_task(taskmanager.Task(name='f', func=utils.noop, reqs='e'))
+        tm._prepare_result_digests()
+        for name in 'abcd':
+            self.assertIsNone(tm.tasks[name].result_digest)
+        self.assertIsNotNone(tm.tasks['e'].result_digest)
+        self.assertIsNotNone(tm.tasks['f'].result_digest)
+
     def test_subtaskmanager(self):
         pass
 
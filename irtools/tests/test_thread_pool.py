@@ -14,18 +14,45 @@ log = logging.getLogger('irtools.tests.thread_pool')
 utils.logging_setup(level=0, log_file=ir_log_dir + '/test_thread_pool.log')
 
 
+class QueueWorker(thread_pool.Worker):
+    """a custom worker consuming its task queue with the Queue API (get / task_done)"""
+
+    def run(self):
+        while self.operating:
+            func, args, kwargs = self.task_queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                self.parent_pool.task_nok(self.worker_id, func, args, kwargs)
+            else:
+                self.parent_pool.task_ok(self.worker_id, func, args, kwargs)
+            finally:
+                self.task_queue.task_done()
+
+
 class TestThreadPool(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # Instantiate a thread pool with 5 worker threads, shared by all the tests
+        log.debug('creating thread pool')
+        cls.pool = thread_pool.ThreadPool(5, trace_logs=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        self.pool.reset_counters()
+
     @staticmethod
     def wait_delay(seconds):
         # Function to be executed in a thread for testing
-        log.trace("sleeping: seconds={}".format(seconds))
+        log.trace('sleeping: seconds=%s', seconds)
         time.sleep(seconds)
 
     def test_map_wait_completion(self):
-        # Instantiate a thread pool with 5 worker threads
-        log.debug('creating thread pool')
-        pool = thread_pool.ThreadPool(5, trace_logs=True)
+        pool = self.pool
 
         # Generate random delays
         delays = [randrange(1, 3) for _ in range(50)]
@@ -36,8 +63,9 @@ class TestThreadPool(unittest.TestCase):
 
         self.assertEquals(50, pool._total_task_count)
 
-        log.debug('waiting for thread pool completion, starting: current_count={} total={} remaining={}'.format(
-            pool.count_completed, pool._total_task_count, pool.count_remaining))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('waiting for thread pool completion, starting: current_count=%s total=%s remaining=%s',
+                      pool.count_completed, pool._total_task_count, pool.count_remaining)
         pool.wait_completion()
         log.debug('waiting for thread pool completion, finished')
 
@@ -45,31 +73,41 @@ class TestThreadPool(unittest.TestCase):
         self.assertEquals(0, pool.count_remaining)
 
     def test_add_wait_finished(self):
-        # Instantiate a thread pool with 5 worker threads
-        log.debug('creating thread pool')
-        pool = thread_pool.ThreadPool(5, trace_logs=True)
+        pool = self.pool
 
         # Generate random delays
+        delays = [randrange(1, 3) for _ in range(50)]
+
         log.debug('adding tasks to thread pool, starting')
-        for _ in range(50):
-            pool.add_task(self.wait_delay, randrange(1, 3))
+        for delay in delays:
+            pool.add_task(self.wait_delay, delay)
         log.debug('adding tasks to thread pool, finished')
 
         self.assertEquals(50, pool._total_task_count)
 
-        log.debug('waiting for thread pool to stop processing, starting: current_count={} total={} remaining={}'.format(
-            pool.count_completed, pool._total_task_count, pool.count_remaining))
-        while pool.processing:
-            pass
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('waiting for thread pool to stop processing, starting: current_count=%s total=%s remaining=%s',
+                      pool.count_completed, pool._total_task_count, pool.count_remaining)
+        self.assertTrue(pool.finished_event.wait(timeout=60))
         log.debug('waiting for thread pool to stop processing, finished')
+        self.assertFalse(pool.processing)
 
         self.assertEquals(50, pool.count_completed)
         self.assertEquals(0, pool.count_remaining)
 
+    def test_add_tasks_wait_completion(self):
+        pool = self.pool
+
+        log.debug('adding tasks to thread pool in bulk')
+        pool.add_tasks((self.wait_delay, (0,), {}) for _ in range(50))
+        self.assertEquals(50, pool._total_task_count)
+
+        pool.wait_completion()
+        self.assertEquals(50, pool.count_completed)
+        self.assertEquals(0, pool.count_remaining)
+
     def test_map_wait_with_progress(self):
-        # Instantiate a thread pool with 5 worker threads
-        log.debug('creating thread pool')
-        pool = thread_pool.ThreadPool(5, trace_logs=True)
+        pool = self.pool
 
         # Generate random delays
         delays = [randrange(1, 3) for _ in range(50)]
@@ -80,10 +118,24 @@ class TestThreadPool(unittest.TestCase):
 
         self.assertEquals(50, pool._total_task_count)
 
-        log.debug('waiting for thread pool with status, starting: current_count={} total={} remaining={}'.format(
-            pool.count_completed, pool._total_task_count, pool.count_remaining))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('waiting for thread pool with status, starting: current_count=%s total=%s remaining=%s',
+                      pool.count_completed, pool._total_task_count, pool.count_remaining)
         pool.wait_with_progress()
         log.debug('waiting for thread pool with status, finished')
 
         self.assertEquals(50, pool.count_completed)
         self.assertEquals(0, pool.count_remaining)
+
+    def test_custom_worker_class(self):
+        pool = thread_pool.ThreadPool(3, worker_class=QueueWorker)
+
+        pool.map(self.wait_delay, [0] * 20)
+        pool.add_task(self.wait_delay, 0)
+        pool.wait_completion()
+        self.assertEquals(21, pool.count_completed)
+        self.assertEquals(21, pool.count_ok)
+        self.assertEquals(0, pool.count_remaining)
+
+        pool.shutdown()
+        self.assertFalse(any(worker.is_alive() for worker in pool._workers.values()))
@@ -3,6 +3,8 @@
 # Standard Imports
 from optparse import OptionParser
 import collections
+import itertools
+import operator
 import signal
 
 # Library Imports
@@ -66,15 +68,17 @@ class OrderedSet(collections.MutableSet):
         end = self.end
         curr = end[2]
         while curr is not end:
-            yield curr[0]
+            key = curr[0]
             curr = curr[2]
+            yield key
 
     def __reversed__(self):
         end = self.end
         curr = end[1]
         while curr is not end:
-            yield curr[0]
+            key = curr[0]
             curr = curr[1]
+            yield key
 
     def pop(self, last=True):
         if not self:
@@ -90,7 +94,8 @@ class OrderedSet(collections.MutableSet):
 
     def __eq__(self, other):
         if isinstance(other, OrderedSet):
-            return len(self) == len(other) and list(self) == list(other)
+            # compare item by item, stopping at the first difference
+            return len(self) == len(other) and all(a == b for a, b in itertools.izip(self, other))
         return set(self) == set(other)
 
 
@@ -100,30 +105,44 @@ class AttributeDict(dict):
     dic[key] == dic.key; both for get and set.
     """
     def __getattr__(self, attr):
-        return self[attr] if attr in self.keys() else None
+        # a single hash lookup (the miss is the rare path)
+        try:
+            return dict.__getitem__(self, attr)
+        except KeyError:
+            return None
 
     def __setattr__(self, attr, value):
-        self[attr] = value
+        dict.__setitem__(self, attr, value)
 
 
 def gen_dict(**kwargs):
     return AttributeDict(kwargs)
 
 
-class SignalCatcher:
+# the signals caught by default and the ones meaning termination, by name since not all exist on every platform
+_catch_signals = tuple(getattr(signal, name) for name in (
+    'SIGHUP', 'SIGINT', 'SIGQUIT', 'SIGUSR1', 'SIGUSR2', 'SIGTERM') if hasattr(signal, name))
+_term_signals = frozenset(getattr(signal, name) for name in ('SIGINT', 'SIGQUIT', 'SIGTERM') if hasattr(signal, name))
+
+
+class SignalCatcher(object):
     """
     Catch signals to allow graceful shutdown.
     @ https://github.com/ryran/reboot-guard/blob/master/rguard#L284:L304
     """
+    __slots__ = ('last_signal', 'received_signal', 'received_term_signal', 'originals')
+
     def __init__(self, signals=None):
         self.last_signal = None
         self.received_signal = False
         self.received_term_signal = False
         # signals
-        signals = signals or [1, 2, 3, 10, 12, 15]
-        self.originals = {signum: signal.getsignal(signum) for signum in signals}
+        signals = signals or _catch_signals
+        getsignal, set_signal, handler = signal.getsignal, signal.signal, self.handler
+        self.originals = {}
         for signum in signals:
-            signal.signal(signum, self.handler)
+            self.originals[signum] = getsignal(signum)
+            set_signal(signum, handler)
 
     def set_handler(self, signum, handler):
         signal.signal(signum, handler)
@@ -135,7 +154,7 @@ class SignalCatcher:
 
         self.last_signal = signum
         self.received_signal = True
-        if signum in [2, 3, 15]:
+        if signum in _term_signals:
             self.received_term_signal = True
 
         signal.signal(signum, self.handler)
@@ -161,6 +180,10 @@ def try_get_rc(ret, raise_on_fail=False, fail_rc=3, **kwargs):
     :return:
     """
 
+    # fast path for the common case of a plain int
+    if type(ret) is int:
+        return ret
+
     rc_attributes = kwargs.pop('rc_attributes', ['rc'])
     parse_execresults = kwargs.pop('parse_execresults', True)
 
@@ -175,7 +198,7 @@ def try_get_rc(ret, raise_on_fail=False, fail_rc=3, **kwargs):
     # if it has an rc attribute, return that (if its an in)
     if isinstance(rc_attributes, (list, tuple, set)):
         for rc_attribute in rc_attributes:
-            if hasattr(rc_attribute, ret):
+            if hasattr(ret, rc_attribute):
                 r = getattr(ret, rc_attribute)
                 if isinstance(r, int):
                     return int(r)
@@ -187,12 +210,23 @@ def try_get_rc(ret, raise_on_fail=False, fail_rc=3, **kwargs):
     return fail_rc  # exception ?
 
 
+# attrgetters by dotted path for deepgetattr, cleared when it grows past the limit
+_dotted_attrgetters = {}
+_dotted_attrgetters_limit = 1024
+
+
 def deepgetattr(obj, attr, default=None, raise_if_missing=False):
     """Recurses through an attribute chain to get the ultimate value."""
-    if isinstance(attr, str):
-        attr = attr.split('.')
+    if not isinstance(attr, basestring):
+        attr = '.'.join(attr)
+    try:
+        getter = _dotted_attrgetters[attr]
+    except KeyError:
+        if len(_dotted_attrgetters) >= _dotted_attrgetters_limit:
+            _dotted_attrgetters.clear()
+        getter = _dotted_attrgetters[attr] = operator.attrgetter(attr)
     try:
-        return reduce(getattr, attr, obj)
+        return getter(obj)
     except AttributeError:
         if raise_if_missing:
             raise
@@ -204,8 +238,11 @@ def deepgetkey(col, key, default=None, raise_if_missing=False):
     if isinstance(key, str):
         key = key.split('.')
     try:
-        return reduce(dict.get, key, col)
-    except KeyError:
+        for name in key:
+            col = col[name]
+        return col
+    except (KeyError, TypeError):
+        # TypeError when a value along the chain is not a collection
         if raise_if_missing:
             raise
         return default
@@ -229,9 +266,9 @@ def parse_cmdline_args(fargs, fkwargs, args):
     fargs = fargs[:]
     fkwargs = convert_list_of_string_params_to_dict(fkwargs, as_bools=True)
     for arg in args:
-        if arg.count('=') == 1:
-            key, value = arg.partition('=')
-            fkwargs[key] = bool_from_text(value)
+        parts = arg.split('=', 1)
+        if len(parts) == 2:
+            fkwargs[parts[0]] = bool_from_text(parts[1])
         else:
             fargs.append(arg)
     return fargs, fkwargs
@@ -251,9 +288,8 @@ def main(args):
         parser.error('No function specified')
         return 0
 
-    functions = {key: value for key, value in globals().items() if callable(value)}
     func_name = args[0]
-    func = functions.get(func_name)
+    func = globals().get(func_name)
 
     if not func or not callable(func):
         parser.error('Function does not exist: {}'.format(func_name))